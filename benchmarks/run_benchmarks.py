@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+""" Benchmark the QC pipeline on synthetic Quartet datasets
+
+Every stage (input_data, qc_info, qc_snr, qc_cor, qc_conclusion and the
+MultiQC report) runs in a fresh process, its wall time and peak RSS are
+recorded per dataset size. With the r engine, protqc.sh runs qc_conclusion
+and the R stages come from stage_timings.tsv.
+
+python run_benchmarks.py [-s small -s dia-50k] [-e python|r] [-o results.json]
+                         [--baseline baseline.json] [--tolerance 0.25] [--timeout SECONDS]
+
+baseline.json holds the results of the python engine on the small & medium sizes.
+
+A stage is a regression when it is slower (or uses more memory) than in the
+baseline by more than the tolerance. The exit code is 1 on a regression or
+when a dataset doesn't finish within the timeout.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic import write_dataset
+
+log = logging.getLogger(__name__)
+
+# Dataset sizes: proteins, peptides, replicates, missing fraction.
+# The pipeline compares 3 replicates per sample, sizes only grow in features.
+SIZES = {
+  'small': dict(proteins=2000, peptides=5000, replicates=3, missing=0.1),
+  'medium': dict(proteins=6000, peptides=20000, replicates=3, missing=0.15),
+  'dia-50k': dict(proteins=8000, peptides=50000, replicates=3, missing=0.2),
+  'dia-150k': dict(proteins=12000, peptides=150000, replicates=3, missing=0.2)
+}
+
+STAGES = ['input_data', 'qc_info', 'qc_snr', 'qc_cor', 'qc_conclusion']
+
+PROTQC_SH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'resources', 'bin', 'protqc.sh')
+
+
+def run_stage(stage, data_file, meta_file, output_dir):
+  """ Run a stage in this (fresh) process, returns its wall time and the peak RSS """
+  from quartet_proteome_report.metrics import input_data, qc_info, qc_snr, qc_cor, qc_conclusion
+  from quartet_proteome_report.metrics.timing import peak_rss
+
+  if stage == 'qc_conclusion':
+    start = time.perf_counter()
+    qc_conclusion(data_file, meta_file, output_dir)
+  elif stage == 'input_data':
+    start = time.perf_counter()
+    input_data(data_file, meta_file)
+  else:
+    data = input_data(data_file, meta_file)
+    start = time.perf_counter()
+    if stage == 'qc_info':
+      qc_info(data['expdata_proteinLevel'], data['metadata'])
+    elif stage == 'qc_snr':
+      qc_snr(data['expdata_proteinLevel'], data['metadata'])
+    elif stage == 'qc_cor' and 'expdata_peptideLevel' in data:
+      qc_cor(data['expdata_peptideLevel'], data['metadata'])
+  return {'seconds': round(time.perf_counter() - start, 3), 'peak_rss_mb': peak_rss()}
+
+
+def run_multiqc(result_dir, report_dir):
+  """ Render the report of result_dir, the plugin records the peak RSS of MultiQC """
+  with open(os.path.join(result_dir, 'general_information.json'), 'w') as f:
+    json.dump({'Report Name': 'benchmark', 'Description': '', 'Report Tool': 'benchmark',
+               'Team': 'Quartet Team', 'Date': time.strftime('%Y-%m-%d')}, f)
+  start = time.perf_counter()
+  subprocess.run(['multiqc', '--force', '--quiet', '-t', 'report_templates', '--outdir', report_dir, result_dir],
+                 check=True, stdout=subprocess.DEVNULL)
+  seconds = round(time.perf_counter() - start, 3)
+  resources_file = os.path.join(report_dir, 'multiqc_data', 'quartet_proteome_report_resources.json')
+  peak = None
+  if os.path.exists(resources_file):
+    with open(resources_file) as f:
+      peak = json.load(f).get('peak_rss_mb')
+  return {'seconds': seconds, 'peak_rss_mb': peak}
+
+
+def run_r(data_file, meta_file, output_dir):
+  """ Run qc_conclusion with protqc.sh, the R stages are read from stage_timings.tsv """
+  start = time.perf_counter()
+  subprocess.run(['bash', PROTQC_SH, '-d', data_file, '-m', meta_file, '-o', output_dir],
+                 check=True, stdout=subprocess.DEVNULL)
+  results = {'qc_conclusion': {'seconds': round(time.perf_counter() - start, 3), 'peak_rss_mb': None}}
+  with open(os.path.join(output_dir, 'stage_timings.tsv')) as f:
+    next(f)
+    for line in f:
+      stage, seconds, peak = line.rstrip('\n').split('\t')
+      results[stage] = {'seconds': float(seconds), 'peak_rss_mb': None if peak == 'NA' else float(peak)}
+  results['qc_conclusion']['peak_rss_mb'] = max(
+    (r['peak_rss_mb'] for r in results.values() if r['peak_rss_mb'] is not None), default=None)
+  return results
+
+
+def benchmark(size, engine, workdir):
+  """ Benchmark all stages on a dataset of the given size """
+  data_dir = os.path.join(workdir, size)
+  result_dir = os.path.join(data_dir, 'results')
+  os.makedirs(result_dir, exist_ok=True)
+  data_file, meta_file = write_dataset(data_dir, **SIZES[size])
+  results = {'dataset': dict(SIZES[size], data_file_bytes=os.path.getsize(data_file))}
+
+  if engine == 'r':
+    results['stages'] = run_r(data_file, meta_file, result_dir)
+  else:
+    results['stages'] = {}
+    context = multiprocessing.get_context('spawn')
+    for stage in STAGES:
+      with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        results['stages'][stage] = executor.submit(run_stage, stage, data_file, meta_file, result_dir).result()
+      log.info('{} {}: {}'.format(size, stage, results['stages'][stage]))
+
+  results['stages']['multiqc'] = run_multiqc(result_dir, os.path.join(data_dir, 'report'))
+  results['total_seconds'] = round(results['stages']['qc_conclusion']['seconds'] +
+                                   results['stages']['multiqc']['seconds'], 3)
+  return results
+
+
+def compare(results, baseline, tolerance):
+  """ Returns the regressions of results against the baseline """
+  regressions = []
+  for size, result in results.items():
+    for stage, current in result['stages'].items():
+      previous = baseline.get(size, {}).get('stages', {}).get(stage)
+      if previous is None:
+        continue
+      for key in ['seconds', 'peak_rss_mb']:
+        if current.get(key) is None or not previous.get(key):
+          continue
+        ratio = current[key] / previous[key]
+        # Stages taking less than 0.1s are too noisy to compare
+        if ratio > 1 + tolerance and not (key == 'seconds' and current[key] < 0.1):
+          regressions.append('{} {} {}: {} -> {} ({:+.0%})'.format(
+            size, stage, key, previous[key], current[key], ratio - 1))
+  return regressions
+
+
+@click.command()
+@click.option('-s', '--size', 'sizes', multiple=True, type=click.Choice(list(SIZES)),
+              help='Dataset sizes, small and medium by default.')
+@click.option('-e', '--engine', default='python', show_default=True, type=click.Choice(['python', 'r']))
+@click.option('-o', '--output', type=click.Path(dir_okay=False), help='Write the results to a JSON file.')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), help='Compare with a results file.')
+@click.option('--tolerance', default=0.25, show_default=True, help='Allowed slowdown against the baseline.')
+@click.option('--timeout', type=float, help='Fail if qc_conclusion and MultiQC take longer (seconds).')
+@click.option('--workdir', type=click.Path(file_okay=False), help='Keep the datasets and reports here.')
+def main(sizes, engine, output, baseline, tolerance, timeout, workdir):
+  """ Benchmark the QC pipeline on synthetic Quartet datasets """
+  logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+  sizes = sizes or ('small', 'medium')
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    results = {size: benchmark(size, engine, workdir or tmp_dir) for size in sizes}
+
+  print(json.dumps(results, indent=2))
+  if output:
+    with open(output, 'w') as f:
+      json.dump(results, f, indent=2)
+
+  failures = []
+  if baseline:
+    with open(baseline) as f:
+      failures += compare(results, json.load(f), tolerance)
+  if timeout:
+    failures += ['{}: {}s exceeds the timeout of {}s'.format(size, r['total_seconds'], timeout)
+                 for size, r in results.items() if r['total_seconds'] > timeout]
+  for failure in failures:
+    log.error(failure)
+  sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+""" Benchmark the startup cost of the MultiQC plugin
+
+The import time of the plugin (the hooks & the report modules, MultiQC
+itself excluded) is read from python -X importtime in fresh processes, with
+the wall time of a MultiQC run on an empty directory: such a run imports
+the hooks and all the report modules, but has nothing to plot.
+
+python startup.py [-n 5] [-o results.json] [--baseline baseline.json] [--tolerance 0.25]
+
+The median of the repeats is kept. Compare two checkouts by passing the
+results of one as the baseline of the other, the exit code is 1 when the
+startup is slower than the baseline by more than the tolerance.
+"""
+
+import json
+import logging
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+log = logging.getLogger(__name__)
+
+PLUGIN = 'quartet_proteome_report'
+
+# What MultiQC imports for a report: the hooks (with multiqc.multiqc), the modules & the template
+PLUGIN_IMPORTS = [
+  'quartet_proteome_report.custom_code',
+  'quartet_proteome_report.modules.general_information',
+  'quartet_proteome_report.modules.conclusion',
+  'quartet_proteome_report.modules.snr',
+  'quartet_proteome_report.modules.correlation',
+  'quartet_proteome_report.modules.supplementary',
+  'quartet_proteome_report.templates.default'
+]
+
+
+def parse_importtime(stderr):
+  """ The cumulative import time (ms) of the outermost plugin imports
+
+  Nested imports are listed before their parent, with a deeper indentation.
+  """
+  times = {}
+  # (depth, plugin imports nested in it) of the imports whose parent is not listed yet
+  pending = []
+  for line in stderr.splitlines():
+    if not line.startswith('import time:') or 'cumulative' in line:
+      continue
+    _, cumulative, name = line[len('import time:'):].split('|')
+    depth = len(name) - len(name.lstrip())
+    name = name.strip()
+    nested = set().union(*(plugin for d, plugin in pending if d > depth))
+    pending = [(d, plugin) for d, plugin in pending if d <= depth]
+    if name.startswith(PLUGIN):
+      for child in nested:
+        times.pop(child, None)
+      times[name] = int(cumulative) / 1000
+      nested = {name}
+    pending.append((depth, nested))
+  return times
+
+
+def measure_imports():
+  """ Import time (ms) of the plugin in a fresh process """
+  code = 'import multiqc.multiqc\n' + ''.join('import {}\n'.format(m) for m in PLUGIN_IMPORTS)
+  result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+  return parse_importtime(result.stderr)
+
+
+def measure_empty_run(analysis_dir, report_dir):
+  """ Wall time (seconds) of a MultiQC run without any result file """
+  start = time.perf_counter()
+  subprocess.run(['multiqc', '--force', '--quiet', '-t', 'report_templates', '--outdir', report_dir, analysis_dir],
+                 check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  return time.perf_counter() - start
+
+
+def benchmark(repeats):
+  imports = [measure_imports() for _ in range(repeats)]
+  names = sorted(set().union(*imports))
+  import_ms = {name: round(statistics.median(run.get(name, 0) for run in imports), 1) for name in names}
+  with tempfile.TemporaryDirectory() as analysis_dir, tempfile.TemporaryDirectory() as report_dir:
+    empty_run = [measure_empty_run(analysis_dir, report_dir) for _ in range(repeats)]
+  return {
+    'imports_ms': import_ms,
+    'plugin_import_ms': round(statistics.median(sum(run.values()) for run in imports), 1),
+    'empty_run_seconds': round(statistics.median(empty_run), 3)
+  }
+
+
+@click.command()
+@click.option('-n', '--repeats', default=5, show_default=True, type=click.IntRange(min=1),
+              help='The number of runs of each measure.')
+@click.option('-o', '--output', type=click.Path(dir_okay=False), help='Write the results to a JSON file.')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), help='Compare with a results file.')
+@click.option('--tolerance', default=0.25, show_default=True, help='Allowed slowdown against the baseline.')
+def main(repeats, output, baseline, tolerance):
+  """ Benchmark the import time of the plugin & an empty MultiQC run """
+  logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+  results = benchmark(repeats)
+
+  print(json.dumps(results, indent=2))
+  if output:
+    with open(output, 'w') as f:
+      json.dump(results, f, indent=2)
+
+  failures = []
+  if baseline:
+    with open(baseline) as f:
+      previous = json.load(f)
+    for key in ['plugin_import_ms', 'empty_run_seconds']:
+      ratio = results[key] / previous[key] if previous.get(key) else 1
+      log.info('{}: {} -> {} ({:+.0%})'.format(key, previous.get(key), results[key], ratio - 1))
+      if ratio > 1 + tolerance:
+        failures.append('{} is {:.0%} slower than the baseline'.format(key, ratio - 1))
+  for failure in failures:
+    log.error(failure)
+  sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+  main()
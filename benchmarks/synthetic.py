@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+""" Synthetic Quartet proteomics datasets for benchmarks
+
+Writes an expression table (Type, Feature, one column per library) and
+a metadata table (library, sample) in the format of protqc::input_data,
+with the four Quartet samples D5, D6, F7 and M8.
+
+Peptides of the reference dataset come first, with the reference log2FC
+between the samples, so that RC is computed on them; the others get random
+sequences. Values are missing more often at low intensities.
+
+python synthetic.py -o OUTPUT_DIR [--proteins 5000] [--peptides 20000] [--missing 0.1]
+"""
+
+import os
+
+import click
+import numpy as np
+import pandas as pd
+
+from quartet_proteome_report.metrics.datasets import load_dataset
+
+SAMPLES = ['D5', 'D6', 'F7', 'M8']
+AMINO_ACIDS = np.array(list('ACDEFGHIKLMNPQRSTVWY'))
+
+
+def sample_levels(n, fold_changes, rng, sd=0.6):
+  """ log2 levels of the samples (n x 4), D6 is the reference of fold_changes """
+  d6 = rng.normal(22, 2, n)
+  levels = np.column_stack([d6 + rng.normal(0, sd, n) for _ in SAMPLES])
+  levels[:, 1] = d6
+  for pair, fc in fold_changes.items():
+    idx = SAMPLES.index(pair.split('/')[0])
+    known = ~np.isnan(fc)
+    levels[known, idx] = d6[known] + fc[known]
+  return levels
+
+
+def random_sequences(n, rng, length=(7, 25)):
+  lengths = rng.integers(length[0], length[1], n)
+  return [''.join(rng.choice(AMINO_ACIDS, l)) + 'K' for l in lengths]
+
+
+def expression_table(feature_type, features, levels, replicates, missing, noise_sd, rng):
+  """ Replicate libraries of the sample levels, with missing values """
+  n = len(features)
+  values = np.repeat(levels, replicates, axis=1) + rng.normal(0, noise_sd, (n, levels.shape[1] * replicates))
+  if missing > 0:
+    # Missing not at random: the lower the intensity, the more likely missing
+    rank = values.mean(axis=1).argsort().argsort() / max(n - 1, 1)
+    prob = np.clip(missing * 2 * (1 - rank), 0, 1)
+    values[rng.random(values.shape) < prob[:, None]] = np.nan
+  table = pd.DataFrame(2 ** values, columns=libraries(replicates))
+  table.insert(0, 'Feature', features)
+  table.insert(0, 'Type', feature_type)
+  return table
+
+
+def libraries(replicates):
+  return ['{}_{}'.format(s, r + 1) for s in SAMPLES for r in range(replicates)]
+
+
+def make_dataset(proteins=5000, peptides=20000, replicates=3, missing=0.1, noise_sd=0.3, seed=1):
+  """ Returns the expression table and the metadata """
+  # The differential expression of qc_cor (both engines) expects 3 replicates per sample
+  if replicates != 3:
+    raise ValueError('The QC pipeline only supports 3 replicates per sample.')
+  rng = np.random.default_rng(seed)
+
+  pro_levels = sample_levels(proteins, {}, rng)
+  pro = expression_table('Protein', ['P{}'.format(i) for i in range(proteins)],
+                         pro_levels, replicates, missing, noise_sd, rng)
+
+  tables = [pro]
+  if peptides > 0:
+    ref = load_dataset('reference_dataset').pivot_table(
+      index='Sequence', columns='Sample.Pair', values='log2FC', aggfunc='mean')
+    ref = ref.iloc[:peptides]
+    sequences = list(ref.index) + random_sequences(peptides - len(ref), rng)
+    fold_changes = {pair: np.concatenate([ref[pair].to_numpy(), np.full(peptides - len(ref), np.nan)])
+                    for pair in ref.columns}
+    pep_levels = sample_levels(peptides, fold_changes, rng)
+    tables.append(expression_table('Peptide', sequences, pep_levels, replicates, missing, noise_sd, rng))
+
+  meta = pd.DataFrame({'library': libraries(replicates),
+                       'sample': [s for s in SAMPLES for _ in range(replicates)]})
+  return pd.concat(tables, ignore_index=True), meta
+
+
+def write_dataset(output_dir, **kwargs):
+  """ Write data.csv & metadata.csv to output_dir, returns their paths """
+  data, meta = make_dataset(**kwargs)
+  data_file = os.path.join(output_dir, 'data.csv')
+  meta_file = os.path.join(output_dir, 'metadata.csv')
+  data.to_csv(data_file, index=False)
+  meta.to_csv(meta_file, index=False)
+  return data_file, meta_file
+
+
+@click.command()
+@click.option('-o', '--output-dir', required=True, type=click.Path(exists=True, file_okay=False))
+@click.option('--proteins', default=5000, show_default=True)
+@click.option('--peptides', default=20000, show_default=True)
+@click.option('--replicates', default=3, show_default=True, type=click.IntRange(3, 3),
+              help='Replicates per sample, the pipeline only supports 3.')
+@click.option('--missing', default=0.1, show_default=True, help='The fraction of missing values.')
+@click.option('--seed', default=1, show_default=True)
+def main(output_dir, proteins, peptides, replicates, missing, seed):
+  """ Generate a synthetic Quartet dataset """
+  for path in write_dataset(output_dir, proteins=proteins, peptides=peptides,
+                            replicates=replicates, missing=missing, seed=seed):
+    print(path)
+
+
+if __name__ == '__main__':
+  main()
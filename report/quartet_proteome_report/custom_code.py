@@ -6,16 +6,33 @@ using the setuptools plugin hooks.
 """
 
 from __future__ import print_function
-from pkg_resources import get_distribution
+import json
 import logging
+import os
+import re
+import time
 
 from multiqc.utils import report, util_functions, config
+from quartet_proteome_report.utils.results import SEARCH_PATTERNS, ResultLoader
+from quartet_proteome_report.utils.plotly import reset_templates
 
 # Initialise the main MultiQC logger
 log = logging.getLogger('multiqc')
 
+
+def plugin_version():
+  """ The version of this plugin (defined in setup.py), without importing pkg_resources """
+  try:
+    from importlib.metadata import version
+  except ImportError:
+    # Python < 3.8
+    from pkg_resources import get_distribution
+    return get_distribution('quartet_proteome_report').version
+  return version('quartet_proteome_report')
+
+
 # Save this plugin's version number (defined in setup.py) to the MultiQC config
-config.quartet_proteome_report_version = get_distribution('quartet_proteome_report').version
+config.quartet_proteome_report_version = plugin_version()
 
 
 # Add default config options for the things that are used in MultiQC_NGI
@@ -32,34 +49,58 @@ def quartet_proteome_report_execution_start():
     return None
 
   log.info('Running Quartet Proteomics MultiQC Plugin v{}'.format(config.quartet_proteome_report_version))
+  config.quartet_proteome_report_start = time.time()
 
   # Add to the main MultiQC config object.
   # User config files have already been loaded at this point
   # so we check whether the value is already set. This is to avoid
   # clobbering values that have been customised by users.
 
-  # Module-general_information
-  if 'general_information/information' not in config.sp:
-    config.update_dict( config.sp, { 'general_information/information': { 'fn_re': '^general_information.json$' } } )
+  for sp_key, fn_re in SEARCH_PATTERNS.items():
+    if sp_key not in config.sp:
+      config.update_dict( config.sp, { sp_key: { 'fn_re': fn_re } } )
 
-  # Module-conclusion
-  if 'conclusion/conclusion_table' not in config.sp:
-    config.update_dict( config.sp, { 'conclusion/conclusion_table': { 'fn_re': '^conclusion_table.tsv$' } } )
-  
-  if 'conclusion/rank_table' not in config.sp:
-    config.update_dict( config.sp, { 'conclusion/rank_table': { 'fn_re': '^rank_table.tsv$' } } )
-  
-  
-  if 'conclusion/cutoff_table' not in config.sp:
-    config.update_dict( config.sp, { 'conclusion/cutoff_table': { 'fn_re': '^cutoff_table.tsv$' } } )
-  
-  # Module-snr
-  if 'snr/table' not in config.sp:
-    config.update_dict( config.sp, { 'snr/table': { 'fn_re': '^pca_table.tsv$' } } )
+  # One loader shared by all modules, the result files are parsed only once
+  config.quartet_proteome_report_results = ResultLoader()
+  # The shared plotly templates are written once per report
+  reset_templates()
+
+  # Plugin settings, can be overridden by the quartet_proteome_report section of a MultiQC config file
+  plugin_config = {
+    # Above this number of points the RC scatter is rendered with WebGL and thinned out
+    'rc_scatter_webgl_threshold': 5000,
+    # Grid resolution (per axis) and points kept per grid cell when thinning
+    'rc_scatter_bins': 150,
+    'rc_scatter_points_per_bin': 2,
+    # Points deviating more than this many (scaled) MADs from the median residual are always kept
+    'rc_scatter_outlier_mad': 3.5,
+    # Above this number of historical batches the Performance Score heatmap groups them
+    # into this number of percentile bins of the total score
+    'score_heatmap_max_batches': 100,
+    'score_heatmap_bins': 20
+  }
+  plugin_config.update(getattr(config, 'quartet_proteome_report', None) or {})
+  config.quartet_proteome_report = plugin_config
 
-  # Module-correlation
-  if 'correlation/table' not in config.sp:
-    config.update_dict( config.sp, { 'correlation/table': { 'fn_re': '^corr_table.tsv$' } } )
-  
   config.module_order = ['general_information', 'conclusion', 'snr', 'correlation', 'supplementary']
-  config.log_filesize_limit = 2000000000
\ No newline at end of file
+  config.log_filesize_limit = 2000000000
+
+def quartet_proteome_report_execution_finish():
+  """ Write the wall time and the peak memory of the MultiQC run to
+  quartet_proteome_report_resources.json in the data directory, the
+  report service collects it with the other stage metrics.
+  """
+  if config.kwargs.get('disable_plugin', True) or not os.path.isdir(config.data_dir or ''):
+    return None
+
+  try:
+    with open('/proc/self/status') as f:
+      hwm = re.search(r'^VmHWM:\s*(\d+)', f.read(), re.M)
+  except OSError:
+    hwm = None
+  resources = {
+    'seconds': round(time.time() - config.quartet_proteome_report_start, 3),
+    'peak_rss_mb': round(int(hwm.group(1)) / 1024, 1) if hwm else None
+  }
+  with open(os.path.join(config.data_dir, 'quartet_proteome_report_resources.json'), 'w') as f:
+    json.dump(resources, f)
@@ -0,0 +1,11 @@
+#!/usr/bin/env python
+""" QC metrics of Quartet proteomics data, a NumPy/SciPy implementation of protqc
+
+The functions follow the R package (protqc/R) and write the same result
+tables, so that the report modules can read them either way.
+"""
+
+from .input import input_data
+from .qc_metrics import qc_info, qc_snr, dep_analysis, qc_cor
+from .qc_pipelines import qc_linear_norm, qc_performance, qc_rank, qc_allmetrics, qc_total
+from .output import qc_conclusion
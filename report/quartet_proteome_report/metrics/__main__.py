@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+""" Command line entry of the metric engine, a drop-in for protqc::qc_conclusion
+
+python -m quartet_proteome_report.metrics -d DATA_FILE -m META_FILE -o RESULT_DIR
+python -m quartet_proteome_report.metrics -b MANIFEST [-j JOBS]
+
+In batch mode, MANIFEST is a TSV file with the columns data_file,
+metadata_file and result_dir. The status of each entry is written to
+MANIFEST.status (result_dir, status, msg), like protqc.sh -b does.
+"""
+
+import logging
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+import pandas as pd
+
+from .datasets import reference_index
+from .output import qc_conclusion
+
+log = logging.getLogger(__name__)
+
+
+def run_entry(data_file, meta_file, result_dir, workers=1):
+  """ Run one entry of a manifest, return its status row """
+  try:
+    qc_conclusion(data_file, meta_file, result_dir, workers)
+    return result_dir, 'Success', ''
+  except Exception as e:
+    log.exception('Failed: {}'.format(result_dir))
+    return result_dir, 'Error', re.sub(r'\s+', ' ', str(e))
+
+
+def run_manifest(manifest, jobs=1, workers=1):
+  """ Run all entries of a manifest, up to `jobs` at once """
+  entries = pd.read_csv(manifest, sep='\t', dtype=str)
+  args = [entries['data_file'], entries['metadata_file'], entries['result_dir'], [workers] * len(entries)]
+  # Loaded before the jobs are forked, shared by all of them
+  reference_index()
+  if jobs == 1 or len(entries) <= 1:
+    status = list(map(run_entry, *args))
+  else:
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+      status = list(executor.map(run_entry, *args))
+
+  with open(manifest + '.status', 'w', encoding='utf-8') as f:
+    f.write('result_dir\tstatus\tmsg\n')
+    f.writelines('\t'.join(row) + '\n' for row in status)
+  return status
+
+
+@click.command()
+@click.option('-d', '--data-file', type=click.Path(exists=True, dir_okay=False),
+              help='Proteomics profiled data.')
+@click.option('-m', '--meta-file', type=click.Path(exists=True, dir_okay=False),
+              help='Metadata file.')
+@click.option('-o', '--result-dir', type=click.Path(exists=True, file_okay=False),
+              help='A directory for result files.')
+@click.option('-b', '--manifest', type=click.Path(exists=True, dir_okay=False),
+              help='Batch mode: a TSV file with the columns data_file, metadata_file and result_dir.')
+@click.option('-j', '--jobs', default=1, show_default=True, type=click.IntRange(min=1),
+              help='The number of entries of a manifest processed in parallel.')
+@click.option('-w', '--workers', default=1, show_default=True, type=click.IntRange(min=1),
+              help='The number of sample pairs analysed in parallel for RC.')
+def main(data_file, meta_file, result_dir, manifest, jobs, workers):
+  """ Calculate the QC metrics and write the result tables """
+  logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+  if manifest is not None:
+    run_manifest(manifest, jobs, workers)
+    return
+
+  if data_file is None or meta_file is None or result_dir is None:
+    raise click.UsageError('-d, -m and -o are required without -b.')
+  qc_conclusion(data_file, meta_file, result_dir, workers)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+""" Reference and historical datasets bundled with protqc
+
+The files in data/ are write.table exports of protqc/data/*.rda, numbers
+are written with their exact shortest representation.
+"""
+
+import os
+
+from .table import read_delim
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Text columns of each dataset, the others are numeric
+TEXT_COLUMNS = {
+  'reference_dataset': ['Sequence', 'Sample.Pair'],
+  'historical_qc': ['Batch'],
+  # Stored as character in protqc, only Total_norm is numeric
+  'historical_qc_norm': ['Batch', 'Absolute Correlation', 'Coefficient of variantion (CV, %)',
+                         'Missing percentage (%)', 'Number of features',
+                         'Relative Correlation with Reference Datasets (RC)',
+                         'Signal-to-Noise Ratio (SNR)', 'Total'],
+  'historical_qc_stat': ['Quality Metrics', 'Historical Value (mean \\u00b1 SD)'],
+  'historical_qc_index': ['Quality Metrics', 'Field']
+}
+
+_datasets = {}
+
+
+def load_dataset(name):
+  """ Return a copy of a bundled dataset, like data(name, package = "protqc") """
+  if name not in _datasets:
+    path = os.path.join(DATA_DIR, '{}.tsv'.format(name))
+    _datasets[name] = read_delim(path, TEXT_COLUMNS[name])
+  return _datasets[name].copy()
+
+
+def reference_index():
+  """ The reference dataset indexed by (Sample.Pair, Sequence), built once and shared """
+  if 'reference_index' not in _datasets:
+    ref_dt = load_dataset('reference_dataset')
+    _datasets['reference_index'] = ref_dt.set_index(['Sample.Pair', 'Sequence']).sort_index()
+  return _datasets['reference_index']
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+""" Input files, see protqc::input_data """
+
+import logging
+
+import pandas as pd
+
+from .table import read_delim, read_header
+
+log = logging.getLogger(__name__)
+
+PROTEIN_TYPES = 'Gene|Protein|protein'
+PEPTIDE_TYPES = 'Peptide|peptide'
+
+
+def input_data(exp_path, meta_path, chunk_size=100000):
+  """ Load and check the expression table and the metadata
+
+  The header of the expression table is checked against the metadata
+  before the body is read, the body is then parsed once, in chunks of
+  rows routed to the protein and peptide tables by Type.
+
+  Returns a dict with the protein level data, the peptide level data
+  (only if provided) and the metadata (columns library and sample).
+  """
+  # Load metadata & the header of data
+  meta = read_delim(meta_path, text_columns=['name', 'library', 'sample'])
+  meta.columns = [c.lower() for c in meta.columns]
+  sep, header = read_header(exp_path)
+
+  # Check data format
+  # Compatible with version 0.1.x.
+  # metadata file: name -> library, sample
+  # data file: rowname -> Type, Feature, xxx
+  if len(set(header)) != len(header):
+    raise ValueError('Duplicated column names in data.')
+
+  if ('name' in meta.columns or 'library' in meta.columns) and 'sample' in meta.columns:
+    meta_final = meta[[c for c in ['name', 'library', 'sample'] if c in meta.columns]]
+    meta_final.columns = ['library', 'sample']
+    meta_final = meta_final.astype(str)
+    if meta_final['library'].duplicated().any():
+      raise ValueError('Duplicated column names in metadata.')
+  else:
+    raise ValueError('The columns named "library" and "sample" are required in metadata.')
+
+  typed = 'Type' in header and 'Feature' in header
+  first_value = 2 if typed else 1
+  if not set(header[first_value:]).issubset(set(meta_final['library'])):
+    raise ValueError('The column names does not correspond to input metadata.')
+  if not typed:
+    log.info('The first column of your expression data is used as features.')
+
+  # Load data in chunks
+  dtype = {c: str for c in header[:first_value]}
+  dtype.update({c: float for c in header[first_value:]})
+  pro_chunks, pep_chunks = [], []
+  for chunk in pd.read_csv(exp_path, sep=sep, dtype=dtype, chunksize=chunk_size):
+    if typed:
+      types = chunk.iloc[:, 0].astype(str)
+      pro_chunks.append(chunk.loc[types.str.contains(PROTEIN_TYPES), header[1:]])
+      pep_chunks.append(chunk.loc[types.str.contains(PEPTIDE_TYPES), header[1:]])
+    else:
+      pro_chunks.append(chunk.rename(columns={header[0]: 'Feature'}))
+
+  columns = header[1:] if typed else ['Feature'] + header[1:]
+  expr_pro = concat_chunks(pro_chunks, columns)
+  expr_pep = concat_chunks(pep_chunks, columns) if typed else None
+  if expr_pep is not None and expr_pep.shape[0] == 0:
+    expr_pep = None
+
+  data = {'expdata_proteinLevel': expr_pro}
+  if expr_pep is not None:
+    data['expdata_peptideLevel'] = expr_pep
+  else:
+    log.info('You only input data at protein levels.')
+  data['metadata'] = meta_final.reset_index(drop=True)
+  return data
+
+
+def concat_chunks(chunks, columns):
+  if not chunks:
+    return pd.DataFrame(columns=columns)
+  return pd.concat(chunks, ignore_index=True)
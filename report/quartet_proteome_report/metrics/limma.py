@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+""" The parts of edgeR and limma used by protqc::dep_analysis
+
+filterByExpr -> calcNormFactors (TMM) -> voom -> lmFit -> eBayes -> topTable,
+ported with the defaults protqc relies on. Every step works on whole
+matrices, the only per-point loop left is the lowess smoother of voom.
+"""
+
+import numpy as np
+from scipy import special, stats
+
+
+### edgeR
+
+def filter_by_expr(counts, design, lib_size=None, min_count=10, min_total_count=15, large_n=10, min_prop=0.7):
+  """ edgeR::filterByExpr: keep the features with worthwhile counts in enough samples """
+  if lib_size is None:
+    lib_size = counts.sum(axis=0)
+  leverage = np.einsum('ij,jk,ik->i', design, np.linalg.pinv(design.T @ design), design)
+  min_sample_size = 1 / leverage.max()
+  if min_sample_size > large_n:
+    min_sample_size = large_n + (min_sample_size - large_n) * min_prop
+  cpm_cutoff = min_count / np.median(lib_size) * 1e6
+  cpm = counts / (1e-6 * lib_size)
+  tol = 1e-14
+  keep_cpm = (cpm >= cpm_cutoff).sum(axis=1) >= (min_sample_size - tol)
+  keep_total_count = counts.sum(axis=1) >= (min_total_count - tol)
+  return keep_cpm & keep_total_count
+
+
+def calc_factor_tmm(obs, ref, libsize_obs, libsize_ref, logratio_trim=0.3, sum_trim=0.05, a_cutoff=-1e10):
+  """ edgeR:::.calcFactorTMM, with precision weighting """
+  with np.errstate(divide='ignore', invalid='ignore'):
+    log_r = np.log2((obs / libsize_obs) / (ref / libsize_ref))
+    abs_e = (np.log2(obs / libsize_obs) + np.log2(ref / libsize_ref)) / 2
+    v = (libsize_obs - obs) / libsize_obs / obs + (libsize_ref - ref) / libsize_ref / ref
+
+  fin = np.isfinite(log_r) & np.isfinite(abs_e) & (abs_e > a_cutoff)
+  log_r = log_r[fin]
+  abs_e = abs_e[fin]
+  v = v[fin]
+  if np.max(np.abs(log_r)) < 1e-6:
+    return 1.0
+
+  n = len(log_r)
+  lo_l = np.floor(n * logratio_trim) + 1
+  hi_l = n + 1 - lo_l
+  lo_s = np.floor(n * sum_trim) + 1
+  hi_s = n + 1 - lo_s
+  rank_r = stats.rankdata(log_r)
+  rank_e = stats.rankdata(abs_e)
+  keep = (rank_r >= lo_l) & (rank_r <= hi_l) & (rank_e >= lo_s) & (rank_e <= hi_s)
+  f = np.nansum(log_r[keep] / v[keep]) / np.nansum(1 / v[keep])
+  if np.isnan(f):
+    f = 0
+  return 2 ** f
+
+
+def calc_norm_factors(counts, lib_size=None):
+  """ edgeR::calcNormFactors(method = "TMM") """
+  nsamples = counts.shape[1]
+  if lib_size is None:
+    lib_size = counts.sum(axis=0)
+  counts = counts[(counts > 0).sum(axis=1) > 0]
+  if counts.shape[0] == 0 or nsamples == 1:
+    return np.ones(nsamples)
+
+  f75 = np.quantile(counts / lib_size, 0.75, axis=0)
+  if np.median(f75) < 1e-20:
+    ref_column = np.argmax(np.sqrt(counts).sum(axis=0))
+  else:
+    ref_column = np.argmin(np.abs(f75 - f75.mean()))
+  f = np.array([calc_factor_tmm(counts[:, i], counts[:, ref_column], lib_size[i], lib_size[ref_column])
+                for i in range(nsamples)])
+  return f / np.exp(np.mean(np.log(f)))
+
+
+### limma
+
+def lowess(x, y, f=2 / 3, iterations=3, delta=None):
+  """ stats::lowess, a port of R's clowess """
+  order = np.argsort(x, kind='stable')
+  x = np.asarray(x, dtype=float)[order]
+  y = np.asarray(y, dtype=float)[order]
+  n = len(x)
+  if delta is None:
+    delta = 0.01 * (x[-1] - x[0])
+  ys = np.zeros(n)
+  if n < 2:
+    ys[:] = y
+    return x, ys
+
+  ns = max(2, min(n, int(f * n + 1e-7)))
+  x_range = x[-1] - x[0]
+  rw = np.ones(n)
+
+  def lowest(i, nleft, nright, use_rw):
+    xs = x[i]
+    h = max(xs - x[nleft], x[nright] - xs)
+    h9 = 0.999 * h
+    h1 = 0.001 * h
+    # Rightmost point (may be beyond nright because of ties)
+    nrt = max(np.searchsorted(x, xs + h9, side='right') - 1, nleft - 1)
+    window = slice(nleft, nrt + 1)
+    r = np.abs(x[window] - xs)
+    w = np.where(r <= h1, 1.0, (1 - (r / h) ** 3) ** 3)
+    w[r > h9] = 0.0
+    if use_rw:
+      w = w * rw[window]
+    a = w.sum()
+    if a <= 0:
+      return None
+    w = w / a
+    if h > 0:
+      a = np.sum(w * x[window])
+      b = xs - a
+      c = np.sum(w * (x[window] - a) ** 2)
+      if np.sqrt(c) > 0.001 * x_range:
+        w = w * (b / c * (x[window] - a) + 1)
+    return np.sum(w * y[window])
+
+  for iteration in range(1, iterations + 2):
+    nleft = 0
+    nright = ns - 1
+    last = -1
+    i = 0
+    while True:
+      if nright < n - 1:
+        # Move the window to the right if the radius decreases
+        if x[i] - x[nleft] > x[nright + 1] - x[i]:
+          nleft += 1
+          nright += 1
+          continue
+
+      fitted = lowest(i, nleft, nright, iteration > 1)
+      ys[i] = y[i] if fitted is None else fitted
+
+      # Interpolate the skipped points
+      if last < i - 1:
+        alpha = (x[last + 1:i] - x[last]) / (x[i] - x[last])
+        ys[last + 1:i] = alpha * ys[i] + (1 - alpha) * ys[last]
+      last = i
+
+      cut = x[last] + delta
+      i = last + 1
+      while i < n:
+        if x[i] > cut:
+          break
+        if x[i] == x[last]:
+          ys[i] = ys[last]
+          last = i
+        i += 1
+      i = max(last + 1, i - 1)
+      if last >= n - 1:
+        break
+
+    res = y - ys
+    if iteration > iterations:
+      break
+    sc = np.mean(np.abs(res))
+    cmad = 6 * np.median(np.abs(res))
+    if cmad < 1e-7 * sc:
+      break
+    r = np.abs(res)
+    rw = np.where(r <= 0.001 * cmad, 1.0, np.where(r <= 0.999 * cmad, (1 - (r / cmad) ** 2) ** 2, 0.0))
+
+  return x, ys
+
+
+def approx_rule2(x, y):
+  """ stats::approxfun(x, y, rule = 2, ties = list("ordered", mean)) """
+  ux, index = np.unique(x, return_inverse=True)
+  uy = np.bincount(index, weights=y) / np.bincount(index)
+  return lambda v: np.interp(v, ux, uy)
+
+
+def lm_fit(y, design, weights=None):
+  """ limma::lmFit for full rank designs and complete data, one least squares fit per row """
+  n, p = design.shape
+  if weights is None:
+    weights = np.ones_like(y)
+  # Per-row normal equations: (X'WX) b = X'Wy
+  xtwx = np.einsum('gi,ij,ik->gjk', weights, design, design)
+  xtwy = np.einsum('gi,ij,gi->gj', weights, design, y)
+  xtwx_inv = np.linalg.inv(xtwx)
+  coefficients = np.einsum('gjk,gk->gj', xtwx_inv, xtwy)
+  residuals = y - coefficients @ design.T
+  df_residual = n - p
+  sigma = np.sqrt(np.sum(weights * residuals ** 2, axis=1) / df_residual)
+  return {
+    'coefficients': coefficients,
+    'stdev_unscaled': np.sqrt(np.diagonal(xtwx_inv, axis1=1, axis2=2)),
+    'sigma': sigma,
+    'df_residual': np.full(y.shape[0], float(df_residual)),
+    'Amean': y.mean(axis=1),
+    'design': design
+  }
+
+
+def voom(counts, design, lib_size=None, span=0.5):
+  """ limma::voom: log-CPM values with observation-level precision weights """
+  if lib_size is None:
+    lib_size = counts.sum(axis=0)
+  y = np.log2((counts + 0.5) / (lib_size + 1) * 1e6)
+  fit = lm_fit(y, design)
+
+  sx = fit['Amean'] + np.mean(np.log2(lib_size + 1)) - np.log2(1e6)
+  sy = np.sqrt(fit['sigma'])
+  allzero = counts.sum(axis=1) == 0
+  lowess_x, lowess_y = lowess(sx[~allzero], sy[~allzero], f=span)
+  trend = approx_rule2(lowess_x, lowess_y)
+
+  fitted_values = fit['coefficients'] @ design.T
+  fitted_count = 1e-6 * (2 ** fitted_values) * (lib_size + 1)
+  weights = 1 / trend(np.log2(fitted_count)) ** 4
+  return y, weights
+
+
+def trigamma_inverse(x):
+  """ limma::trigammaInverse, Newton iteration for the inverse of the trigamma function """
+  if x > 1e7:
+    return 1 / np.sqrt(x)
+  if x < 1e-6:
+    return 1 / x
+  y = 0.5 + 1 / x
+  for _ in range(50):
+    tri = special.polygamma(1, y)
+    dif = tri * (1 - tri / x) / special.polygamma(2, y)
+    y = y + dif
+    if -dif / y < 1e-8:
+      break
+  return y
+
+
+def fit_f_dist(x, df1):
+  """ limma::fitFDist: moment estimation of the scaled F-distribution of the variances """
+  ok = ~np.isnan(x) & np.isfinite(df1) & (df1 > 1e-15)
+  x = np.maximum(x[ok], 0)
+  df1 = df1[ok]
+  n = len(x)
+  m = np.median(x)
+  if m == 0:
+    m = 1
+  x = np.maximum(x, 1e-5 * m)
+  e = np.log(x) - special.digamma(df1 / 2) + np.log(df1 / 2)
+  emean = np.mean(e)
+  evar = np.sum((e - emean) ** 2) / (n - 1) - np.mean(special.polygamma(1, df1 / 2))
+  if evar > 0:
+    df2 = 2 * trigamma_inverse(evar)
+    s20 = np.exp(emean + special.digamma(df2 / 2) - np.log(df2 / 2))
+  else:
+    df2 = np.inf
+    s20 = np.exp(emean)
+  return s20, df2
+
+
+def squeeze_var(var, df):
+  """ limma::squeezeVar: empirical Bayes posterior variances """
+  var_prior, df_prior = fit_f_dist(var, df)
+  if np.isinf(df_prior):
+    var_post = np.full_like(var, var_prior)
+  else:
+    var_post = (df * var + df_prior * var_prior) / (df + df_prior)
+  return var_post, var_prior, df_prior
+
+
+def tmixture_vector(tstat, stdev_unscaled, df, proportion, v0_lim):
+  """ limma:::tmixture.vector: prior variance of the non-null coefficients """
+  ok = ~np.isnan(tstat)
+  tstat = tstat[ok]
+  stdev_unscaled = stdev_unscaled[ok]
+  df = df[ok]
+  ngenes = len(tstat)
+  ntarget = int(np.ceil(proportion / 2 * ngenes))
+  if ntarget < 1:
+    return np.nan
+  p = max(ntarget / ngenes, proportion)
+  tstat = np.abs(tstat)
+  max_df = np.max(df)
+  i = df < max_df
+  if np.any(i):
+    # The upper tail, as limma: the lower tail rounds to 1 for large t
+    tail_p = stats.t.logsf(tstat[i], df[i])
+    tstat[i] = stats.t.isf(np.exp(tail_p), max_df)
+    df[i] = max_df
+  o = np.argsort(-tstat, kind='stable')[:ntarget]
+  tstat = tstat[o]
+  v1 = stdev_unscaled[o] ** 2
+  r = np.arange(1, ntarget + 1)
+  p0 = 2 * stats.t.sf(tstat, max_df)
+  ptarget = ((r - 0.5) / ngenes - (1 - p) * p0) / p
+  v0 = np.zeros(ntarget)
+  pos = ptarget > p0
+  if np.any(pos):
+    qtarget = stats.t.isf(ptarget[pos] / 2, max_df)
+    v0[pos] = v1[pos] * ((tstat[pos] / qtarget) ** 2 - 1)
+  v0 = np.minimum(np.maximum(v0, v0_lim[0]), v0_lim[1])
+  return np.mean(v0)
+
+
+def ebayes(fit, coef, proportion=0.01, stdev_coef_lim=(0.1, 4)):
+  """ limma::eBayes for one coefficient: moderated t-statistics, p-values and log-odds """
+  coefficients = fit['coefficients'][:, coef]
+  stdev_unscaled = fit['stdev_unscaled'][:, coef]
+  df_residual = fit['df_residual']
+  s2_post, s2_prior, df_prior = squeeze_var(fit['sigma'] ** 2, df_residual)
+
+  t = coefficients / stdev_unscaled / np.sqrt(s2_post)
+  df_total = np.minimum(df_residual + df_prior, np.sum(df_residual))
+  p_value = 2 * stats.t.sf(np.abs(t), df_total)
+
+  var_prior_lim = np.array(stdev_coef_lim) ** 2 / s2_prior
+  var_prior = tmixture_vector(t, stdev_unscaled, df_total.copy(), proportion, var_prior_lim)
+  if np.isnan(var_prior):
+    var_prior = 1 / s2_prior
+  r = (stdev_unscaled ** 2 + var_prior) / stdev_unscaled ** 2
+  t2 = t ** 2
+  if df_prior > 1e6:
+    kernel = t2 * (1 - 1 / r) / 2
+  else:
+    kernel = (1 + df_total) / 2 * np.log((t2 + df_total) / (t2 / r + df_total))
+  lods = np.log(proportion / (1 - proportion)) - np.log(r) / 2 + kernel
+  return {'logFC': coefficients, 't': t, 'P.Value': p_value, 'B': lods}
+
+
+def p_adjust_bh(p):
+  """ stats::p.adjust(p, method = "BH") """
+  p = np.asarray(p, dtype=float)
+  n = len(p)
+  if n == 0:
+    return p
+  o = np.argsort(-p, kind='stable')
+  i = np.arange(n, 0, -1)
+  adjusted = np.minimum(1, np.minimum.accumulate(n / i * p[o]))
+  result = np.empty(n)
+  result[o] = adjusted
+  return result
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+""" Generating the tables of conclusion, see protqc/R/output.R """
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from .datasets import load_dataset
+from .input import input_data
+from .qc_metrics import r_round
+from .qc_pipelines import baseline_index, baseline_index_from_table, count_greater_equal, qc_allmetrics, qc_total
+from .table import format_number, write_result_table
+from .timing import reset_timings, time_stage, write_timings
+
+# The bundled historical datasets & their baseline index
+_bundled = {}
+
+
+def total_cutoff(total_norm, his_ref_norm=None, ref=None):
+  """ The percentile of the total score among the historical ones, e.g. "62.5%"
+
+  ref is the 'Total' entry of a baseline_index, built from his_ref_norm if not given.
+  """
+  if ref is None:
+    his_ref_norm = np.asarray(his_ref_norm, dtype=float)
+    ref = {'sorted': np.sort(his_ref_norm[~np.isnan(his_ref_norm)]), 'length': len(his_ref_norm)}
+  if total_norm == 10:
+    return '100%'
+  greater, equal = count_greater_equal(total_norm, ref['sorted'])
+  if equal > 0:
+    # Ranked among the historical scores, tied with some of them
+    total_num = ref['length']
+    total_pos = np.floor(greater + (equal + 1) / 2)
+  else:
+    total_num = ref['length'] + 1
+    total_pos = np.floor(greater + 1)
+  total_perc = (total_num - total_pos) / total_num
+  return format_number(r_round(total_perc, 4) * 100) + '%'
+
+
+def bundled_baseline():
+  """ The bundled historical datasets and their baseline index (historical_qc_index,
+  built by protqc::qc_history with the datasets), loaded once per process """
+  if not _bundled:
+    _bundled['ref_qc'] = load_dataset('historical_qc')
+    _bundled['ref_qc_norm'] = load_dataset('historical_qc_norm')
+    _bundled['ref_qc_stat'] = load_dataset('historical_qc_stat')
+    _bundled['index'] = baseline_index_from_table(load_dataset('historical_qc_index'))
+  return _bundled
+
+
+def conclusion_tables(allmetrics_dt):
+  """ The rank, conclusion and cutoff tables of the metric values (a qc_allmetrics
+  output_table), scored against the bundled historical datasets """
+  # Load historical QC results
+  baseline = bundled_baseline()
+  ref_qc = baseline['ref_qc']
+  ref_qc_norm = baseline['ref_qc_norm']
+  ref_qc_stat = baseline['ref_qc_stat']
+  index = baseline['index']
+
+  output_list = qc_total(allmetrics_dt, ref_qc, ref_qc_norm, ref_qc_stat, index)
+  output_table = output_list['Raw']
+
+  # Cut-off
+  total_norm = output_table['Value'].iloc[-1]
+  output_cutoff = pd.DataFrame({
+    'Cut-off': ['0%', '20%', '50%', '80%', '100%', total_cutoff(total_norm, ref=index['Total'])],
+    'Percentile': list(np.quantile(index['Total']['sorted'], [0, 0.25, 0.5, 0.75, 1])) + [total_norm]
+  })
+
+  # Save & Output: the historical scores, then the queried one
+  output_table2 = output_list['Normalized']
+  output_table_o = output_table2.sort_values('Quality Metrics', kind='stable')
+  ref_qc_norm_new = ref_qc_norm.copy()
+  ref_qc_norm_new['Total_norm'] = [np.nan if np.isnan(x) else format_number(x) for x in ref_qc_norm['Total_norm']]
+  queried = ['QUERIED DATA'] + [np.nan if pd.isna(x) else format_number(x) for x in output_table_o['Value']]
+  ref_qc_norm_new.loc[len(ref_qc_norm_new)] = queried
+
+  return {'rank_table': ref_qc_norm_new, 'conclusion_table': output_table, 'cutoff_table': output_cutoff}
+
+
+def qc_conclusion(exp_path, meta_path, output_dir=None, workers=1):
+  """ Generating a table of conclusion
+
+  Runs all the QC pipelines and writes rank_table.tsv, conclusion_table.tsv
+  and cutoff_table.tsv (with pca_table.tsv, deps_table.tsv and corr_table.tsv)
+  to the output directory. Returns a dict with all results and the conclusion table.
+  """
+  reset_timings()
+
+  # Load historical QC results
+  bundled_baseline()
+
+  # Load the input data
+  with time_stage('input_data'):
+    data = input_data(exp_path, meta_path)
+  pro_data = data['expdata_proteinLevel']
+  meta = data['metadata']
+  pep_data = data.get('expdata_peptideLevel')
+
+  # Run the QC pipelines
+  allmetrics_results = qc_allmetrics(pro_data, meta, pep_data, output_dir, workers)
+  with time_stage('qc_total'):
+    tables = conclusion_tables(allmetrics_results['output_table'])
+  output_table = tables['conclusion_table']
+
+  if output_dir is not None:
+    for name, table in tables.items():
+      write_result_table(table, output_dir, name)
+    write_timings(os.path.join(output_dir, 'stage_timings.tsv'))
+
+  return {'results': allmetrics_results, 'conclusion': output_table}
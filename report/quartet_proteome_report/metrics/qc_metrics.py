@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+""" QC metrics of one batch, see protqc/R/qc_metrics.R
+
+qc_info: number of features, missing percentage, absolute correlation, CV
+qc_snr: signal-to-noise ratio from a PCA of the protein level data
+qc_cor: relative correlation of the differential expression with the reference dataset
+"""
+
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from . import limma
+from .datasets import reference_index
+from .table import write_result_table
+
+log = logging.getLogger(__name__)
+
+R_RESERVED = {'if', 'else', 'repeat', 'while', 'function', 'for', 'next', 'break', 'in',
+              'TRUE', 'FALSE', 'NULL', 'Inf', 'NaN', 'NA', 'NA_integer_', 'NA_real_', 'NA_character_'}
+
+
+def r_round(x, digits=0):
+  """ round() of R (>= 4.0.0): the representable candidate closest to x """
+  if x is None or np.isnan(x):
+    return np.nan
+  return round(float(x), digits)
+
+
+def make_names(names):
+  """ make.names(names, unique = TRUE), as done by data.frame(check.names = TRUE) """
+  valid = []
+  for name in names:
+    name = re.sub(r'[^A-Za-z0-9._]', '.', str(name))
+    if not re.match(r'^([A-Za-z]|\.(?![0-9]))', name):
+      name = 'X' + name
+    if name in R_RESERVED:
+      name = name + '.'
+    valid.append(name)
+
+  seen = {}
+  unique = []
+  for name in valid:
+    if name in seen:
+      seen[name] += 1
+      while '{}.{}'.format(name, seen[name]) in valid:
+        seen[name] += 1
+      unique.append('{}.{}'.format(name, seen[name]))
+    else:
+      seen[name] = 0
+      unique.append(name)
+  return unique
+
+
+def expression_matrix(expr_dt):
+  """ A copy of the numeric part of an expression table as a float matrix """
+  return np.array(expr_dt.iloc[:, 1:], dtype=float)
+
+
+### Basic information
+
+def pairwise_cor_test(x):
+  """ psych::corr.test(x, method = "pearson", adjust = "fdr") with pairwise complete observations
+
+  Returns the correlation matrix and the p-value matrix: the upper triangle
+  holds the FDR adjusted p-values, the lower triangle the raw ones.
+  """
+  present = ~np.isnan(x)
+  mask = present.astype(float)
+  # Center the columns to keep the sums of products small
+  x0 = np.where(present, x - np.nanmean(x, axis=0), 0)
+
+  n = mask.T @ mask
+  sx = x0.T @ mask
+  sxx = (x0 ** 2).T @ mask
+  sxy = x0.T @ x0
+  with np.errstate(divide='ignore', invalid='ignore'):
+    cov = sxy - sx * sx.T / n
+    r = cov / np.sqrt((sxx - sx ** 2 / n) * (sxx.T - sx.T ** 2 / n))
+    np.fill_diagonal(r, 1)
+    t = r * np.sqrt(n - 2) / np.sqrt(1 - r ** 2)
+    p = 2 * stats.t.sf(np.abs(t), n - 2)
+  np.fill_diagonal(p, 0)
+
+  upper = np.triu_indices_from(p, k=1)
+  p[upper] = limma.p_adjust_bh(p[upper])
+  return r, p
+
+
+def qc_info(expr_dt, meta_dt):
+  """ Statistics for basic information
+
+  Returns the number of features, the missing percentage, the absolute
+  correlation and the CV of the expression profile.
+  """
+  d = expr_dt.copy()
+  values = expression_matrix(d)
+  values[values == 0] = np.nan
+  d = pd.concat([d.iloc[:, :1], pd.DataFrame(values, columns=d.columns[1:], index=d.index)], axis=1)
+
+  # Statistics: number of features
+  stat_num = d.iloc[:, 0].nunique(dropna=False)
+
+  # Statistics: missing percentage
+  d_all_num = d.shape[0] * (d.shape[1] - 1)
+  d_missing_num = int(d.isna().to_numpy().sum())
+  stat_missing = r_round(d_missing_num * 100 / d_all_num, 3)
+
+  # Check if replicates available
+  samples = meta_dt['sample'].value_counts()
+  if not (samples > 1).any():
+    raise ValueError('No replicates are available.')
+
+  # Calculating: absolute correlation, over the pairs of replicates
+  library_sample = dict(zip(meta_dt['library'], meta_dt['sample']))
+  groups = np.array([library_sample.get(c) for c in d.columns[1:]], dtype=object)
+  known = np.array([c in library_sample for c in d.columns[1:]])
+  r, p = pairwise_cor_test(values)
+  r[p > 0.05] = 0
+  same = (groups[:, None] == groups[None, :]) & known[:, None] & known[None, :]
+  np.fill_diagonal(same, False)
+  stat_acor = r_round(np.median(r[same]), 3)
+
+  # Calculating: CV
+  stat_cv = r_round(np.nanmedian(group_cv(values, d.iloc[:, 0], groups)) * 100, 3)
+
+  return [stat_num, stat_missing, stat_acor, stat_cv]
+
+
+def group_cv(values, feature, group):
+  """ Coefficients of variation of each feature within each sample
+
+  Works on the wide matrix, one block of columns per sample, like
+  aggregate(value ~ feature + sample, FUN = sd / mean) over the long table:
+  missing values are left out, rows of the same feature are pooled and all
+  values are 2^x if any of them is negative. NaN for single values.
+  """
+  feature = pd.Series(feature)
+  keep = feature.notna().to_numpy()
+  values = values[keep]
+  codes, uniques = pd.factorize(feature[keep])
+
+  if (values[~np.isnan(values)] < 0).any():
+    values = 2 ** values
+    log.info('There are negative values. Default to log2-transformed values.')
+
+  group = np.asarray(group, dtype=object)
+  cv = []
+  for g in pd.unique(group[pd.notna(group)]):
+    x = values[:, group == g]
+    present = ~np.isnan(x)
+    x0 = np.where(present, x, 0)
+    # Sums per feature, the rows of duplicated features are added up
+    n = np.bincount(codes, weights=present.sum(axis=1), minlength=len(uniques))
+    x_sum = np.bincount(codes, weights=x0.sum(axis=1), minlength=len(uniques))
+    with np.errstate(divide='ignore', invalid='ignore'):
+      x_mean = x_sum / n
+      x_dev = np.where(present, (x - x_mean[codes][:, None]) ** 2, 0)
+      x_ss = np.bincount(codes, weights=x_dev.sum(axis=1), minlength=len(uniques))
+      x_sd = np.where(n > 1, np.sqrt(x_ss / (n - 1)), np.nan)
+      cv.append((x_sd / x_mean)[n > 0])
+  return np.concatenate(cv) if cv else np.array([])
+
+
+### SNR
+
+def prcomp(x, rank=2, randomized=False):
+  """ prcomp(x, scale. = TRUE): PC scores and the proportion of variance of each PC
+
+  The randomized PCA only computes the first `rank` PCs, with a few power
+  iterations (Halko et al., 2011). The proportions of variance stay exact,
+  the total variance of scaled data is the number of columns.
+  """
+  n, p = x.shape
+  sd = x.std(axis=0, ddof=1)
+  if np.any(sd == 0):
+    raise ValueError('cannot rescale a constant/zero column to unit variance')
+  z = (x - x.mean(axis=0)) / sd
+
+  if not randomized:
+    u, d, vt = np.linalg.svd(z, full_matrices=False)
+    k = min(n, p)
+    scores = z @ vt[:k].T
+    variance = (d[:k] / np.sqrt(max(1, n - 1))) ** 2
+    return scores, variance / variance.sum()
+
+  rank = min(rank, n, p)
+  rng = np.random.default_rng(1)
+  # Range finder & power iterations
+  q, _ = np.linalg.qr(z @ rng.standard_normal((p, min(rank + 10, n, p))))
+  for _ in range(2):
+    q, _ = np.linalg.qr(z.T @ q)
+    q, _ = np.linalg.qr(z @ q)
+  u, d, vt = np.linalg.svd(q.T @ z, full_matrices=False)
+  scores = q @ u[:, :rank] * d[:rank]
+  return scores, d[:rank] ** 2 / max(1, n - 1) / p
+
+
+def signal_to_noise(scores, percent, group, n_components=2):
+  """ SNR (dB): the average weighted distance between the samples of
+  different groups over the one between the replicates of a group """
+  group = np.asarray(group)
+  weighted = scores[:, :n_components] * np.sqrt(percent[:n_components])
+  # Squared euclidean distances of all ordered pairs, the pairs of a sample with itself included
+  sq = np.sum(weighted ** 2, axis=1)
+  dist = np.maximum(sq[:, None] + sq[None, :] - 2 * weighted @ weighted.T, 0)
+  np.fill_diagonal(dist, 0)
+
+  same_group = group[:, None] == group[None, :]
+  intra = same_group.copy()
+  np.fill_diagonal(intra, False)
+  inter = ~same_group
+  signoise = dist[inter].mean() / dist[intra].mean()
+  return r_round(10 * np.log10(signoise), 3)
+
+
+def randomized_pca():
+  """ PROTQC_RANDOMIZED_PCA=1 switches qc_snr to the randomized PCA by default """
+  return os.environ.get('PROTQC_RANDOMIZED_PCA', '0') == '1'
+
+
+def qc_snr(expr_dt, meta_dt, output_dir=None, n_components=2, randomized=None):
+  """ Calculating the SNR value, from the first n_components PCs
+
+  Returns a dict with the PCA table and the SNR. The table is written to
+  pca_table.tsv if an output directory is given. A randomized PCA only keeps
+  the PCs used, which is much faster on wide inputs; the SNR may differ in
+  the last digit when the PCs used and the next one explain similar variances.
+  `randomized` defaults to PROTQC_RANDOMIZED_PCA.
+  """
+  if randomized is None:
+    randomized = randomized_pca()
+  if expr_dt.iloc[:, 0].duplicated().any():
+    raise ValueError('duplicate \'row.names\' are not allowed')
+  ids = make_names(expr_dt.columns[1:])
+  group = meta_dt['sample'].tolist()
+
+  # Replace NA by zero
+  x = np.nan_to_num(expression_matrix(expr_dt)).T
+
+  # PCA
+  scores, variance = prcomp(x, max(2, n_components), randomized)
+  percent = np.array([r_round(v, 5) for v in variance])
+  signoise_db = signal_to_noise(scores, percent, group, n_components)
+
+  pcs = pd.DataFrame(scores, columns=['PC{}'.format(i + 1) for i in range(scores.shape[1])])
+  output = pd.concat([pd.DataFrame({'sample_id': ids, 'sample': group}), pcs], axis=1)
+
+  if output_dir is not None:
+    write_result_table(output, output_dir, 'pca_table')
+
+  return {'table': output, 'SNR': signoise_db}
+
+
+### RC
+
+def dep_analysis(counts, sequences, group, levels):
+  """ Differential expression between the two levels of group, with edgeR and limma-voom
+
+  Columns of the result: logFC, AveExpr, t, P.Value, adj.P.Val, B, Sequence,
+  Sequence.Number, Sample1, Sample2 and Sample.Pair. Rows are sorted by |logFC|.
+  """
+  group = np.asarray(group)
+  # model.matrix(~ group) of an ordered factor: an intercept and a linear contrast
+  contrast = np.where(group == levels[1], np.sqrt(0.5), -np.sqrt(0.5))
+  design = np.column_stack([np.ones(len(group)), contrast])
+
+  keep = limma.filter_by_expr(counts, design)
+  counts = counts[keep]
+  sequences = np.asarray(sequences)[keep]
+  lib_size = counts.sum(axis=0)
+  norm_factors = limma.calc_norm_factors(counts, lib_size)
+
+  y, weights = limma.voom(counts, design, lib_size * norm_factors)
+  fit = limma.lm_fit(y, design, weights)
+  coef = design.shape[1] - 1
+  result = limma.ebayes(fit, coef)
+
+  table = pd.DataFrame({
+    'logFC': result['logFC'],
+    'AveExpr': fit['Amean'],
+    't': result['t'],
+    'P.Value': result['P.Value'],
+    'adj.P.Val': limma.p_adjust_bh(result['P.Value']),
+    'B': result['B']
+  })
+  order = np.argsort(-np.abs(table['logFC'].to_numpy()), kind='stable')
+  table = table.iloc[order].reset_index(drop=True)
+  table['Sequence'] = sequences[order]
+  table['Sequence.Number'] = np.int64(len(table))
+  table['Sample1'] = levels[0]
+  table['Sample2'] = levels[1]
+  table['Sample.Pair'] = '{}/{}'.format(levels[1], levels[0])
+  return table
+
+
+def qc_cor(expr_dt, meta_dt, output_dir=None, workers=1):
+  """ Calculating the RC value
+
+  Every sample is compared with D6, on up to `workers` processes, and the
+  significant log2 fold changes are correlated with the reference dataset. Returns a dict with the DEPs, the
+  joined fold changes and the RC. The DEP and the fold change tables are
+  written to deps_table.tsv and corr_table.tsv if an output directory is given.
+  """
+  ref_dt = reference_index()
+  sequences = expr_dt.iloc[:, 0].astype(str).to_numpy()
+  if pd.Series(sequences).duplicated().any():
+    raise ValueError('duplicate \'row.names\' are not allowed')
+  expr_matrix = np.array(expr_dt[meta_dt['library'].tolist()], dtype=float)
+
+  # Replace NA by zero
+  expr_matrix[np.isnan(expr_matrix)] = 0
+
+  # Check if negative values exist
+  if (expr_matrix < 0).any():
+    expr_matrix = 2 ** expr_matrix
+    log.info('There are negative values. Default to log2-transformed values.')
+
+  # Check the grouping info
+  samples = list(pd.unique(meta_dt['sample'].astype(str)))
+  if len(samples) <= 1:
+    raise ValueError('No grouping info.')
+  if 'D6' not in samples:
+    raise ValueError('No D6 samples are available.')
+  samples = ['D6'] + [s for s in samples if s != 'D6']
+
+  # Analysis: Differential expression
+  # The sample pairs are independent: run them on a pool of workers
+  # and combine the results once, in the order of the pairs.
+  meta_samples = meta_dt['sample'].astype(str).to_numpy()
+  jobs = []
+  for sample in samples[1:]:
+    sample_pair = '{}/D6'.format(sample)
+    ref_sequences = ref_dt.index.get_level_values('Sequence')[ref_dt.index.get_locs([sample_pair])]
+
+    columns = np.concatenate([np.flatnonzero(meta_samples == sample), np.flatnonzero(meta_samples == 'D6')])
+    e_tmp = expr_matrix[:, columns]
+    rows = ((e_tmp == 0).sum(axis=1) < 3) & np.isin(sequences, ref_sequences.to_numpy())
+
+    group = np.repeat([sample, 'D6'], 3)
+    jobs.append((e_tmp[rows], sequences[rows], group, ['D6', sample]))
+
+  workers = max(1, min(workers, len(jobs)))
+  if workers == 1:
+    results = [dep_analysis(*job) for job in jobs]
+  else:
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+      results = list(executor.map(dep_analysis, *zip(*jobs)))
+  results = [result[result['adj.P.Val'] < 0.05] for result in results]
+  result_final = pd.concat(results, ignore_index=True)
+
+  # Calculating: RC
+  result_withref = result_final[['Sample.Pair', 'Sequence', 'logFC']].join(
+    ref_dt['log2FC'], on=['Sample.Pair', 'Sequence'], how='inner')
+  result_withref.insert(0, 'name', result_withref['Sequence'] + ' ' + result_withref['Sample.Pair'])
+  result_withref = result_withref.sort_values('name', kind='stable').reset_index(drop=True)
+
+  df_test = result_withref[['name', 'Sequence', 'Sample.Pair', 'logFC', 'log2FC']]
+  df_test.columns = ['Name', 'Sequence', 'Sample.Pair', 'logFC.Test', 'logFC.Reference']
+
+  cor_value = r_round(np.corrcoef(df_test['logFC.Test'], df_test['logFC.Reference'])[0, 1], 3)
+
+  if output_dir is not None:
+    write_result_table(result_final, output_dir, 'deps_table')
+    write_result_table(df_test, output_dir, 'corr_table')
+
+  return {'DEPs': result_final, 'logfc': df_test, 'COR': cor_value}
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+""" QC pipelines: normalization, ranking and total score, see protqc/R/qc_pipelines.R """
+
+import numpy as np
+import pandas as pd
+
+from .qc_metrics import qc_info, qc_snr, qc_cor, r_round
+from .timing import time_stage
+
+METRICS = [
+  'Number of features',
+  'Missing percentage (%)',
+  'Absolute Correlation',
+  'Coefficient of variantion (CV, %)',
+  'Signal-to-Noise Ratio (SNR)',
+  'Relative Correlation with Reference Datasets (RC)'
+]
+
+# The lower the better
+DECREASING_METRICS = ['Coefficient of variantion (CV, %)', 'Missing percentage (%)']
+
+PERFORMANCE = ['Bad', 'Fair', 'Good', 'Great']
+
+
+def qc_linear_norm(x, x_min, x_max, decreasing=False):
+  """ Linear normalization: 1~10, a single value is clamped to [x_min, x_max] """
+  x = np.atleast_1d(np.asarray(x, dtype=float))
+  if len(x) == 1:
+    x = np.clip(x, x_min, x_max)
+  if decreasing:
+    x_norm = 10 - (x - x_min) * 9 / (x_max - x_min)
+  else:
+    x_norm = 1 + (x - x_min) * 9 / (x_max - x_min)
+  x_norm = [r_round(v, 3) for v in x_norm]
+  return x_norm[0] if len(x_norm) == 1 else x_norm
+
+
+CUTOFF = (0, 0.2, 0.5, 0.8, 1)
+
+
+def baseline_index(ref_qc, ref_qc_norm, cutoff=CUTOFF):
+  """ Everything qc_total needs from a historical baseline, computed once
+
+  For each metric (and the total score): the min/max of the raw values, the
+  sorted normalized values and their quantile cutoffs, so that scoring a
+  submission only takes lookups and binary searches.
+  """
+  index = {}
+  for m in METRICS + ['Total']:
+    x_ref = pd.to_numeric(ref_qc_norm[m] if m == 'Total' else ref_qc[m], errors='coerce').to_numpy(dtype=float)
+    x_ref_norm = pd.to_numeric(ref_qc_norm['Total_norm' if m == 'Total' else m], errors='coerce').to_numpy(dtype=float)
+    sorted_norm = np.sort(x_ref_norm[~np.isnan(x_ref_norm)])
+    index[m] = {
+      # The total score is normalized with min/max, NA included, like protqc
+      'min': x_ref.min() if m == 'Total' else np.nanmin(x_ref),
+      'max': x_ref.max() if m == 'Total' else np.nanmax(x_ref),
+      'sorted': sorted_norm,
+      'length': len(x_ref_norm),
+      'cutoffs': np.quantile(sorted_norm, cutoff)
+    }
+  return index
+
+
+def baseline_index_from_table(index_dt):
+  """ The baseline index shipped as historical_qc_index (Quality Metrics, Field, Value),
+  see qc_baseline_index_table in protqc """
+  index = {}
+  for m, ref in index_dt.groupby('Quality Metrics', sort=False):
+    values = {field: ref['Value'][ref['Field'] == field].to_numpy(dtype=float)
+              for field in ['min', 'max', 'length', 'cutoff', 'sorted']}
+    index[m] = {
+      'min': values['min'][0],
+      'max': values['max'][0],
+      'sorted': values['sorted'],
+      'length': int(values['length'][0]),
+      'cutoffs': values['cutoff']
+    }
+  return index
+
+
+def count_greater_equal(x, x_sorted):
+  """ The numbers of values greater than and equal to x in a sorted array """
+  lower = np.searchsorted(x_sorted, x, side='left')
+  upper = np.searchsorted(x_sorted, x, side='right')
+  return len(x_sorted) - upper, upper - lower
+
+
+def qc_performance(x, x_ref=None, cutoff=CUTOFF, ref_perc=None):
+  """ Label the performance: bad, fair, good, great
+
+  ref_perc are the quantiles of x_ref at cutoff, computed if not given.
+  """
+  if ref_perc is None:
+    x_ref = np.asarray(x_ref, dtype=float)
+    ref_perc = np.quantile(x_ref[~np.isnan(x_ref)], cutoff)
+  for i, x_class in enumerate(PERFORMANCE):
+    if ref_perc[i] <= x <= ref_perc[i + 1]:
+      return x_class
+  raise ValueError('{} is out of the range of the reference values.'.format(x))
+
+
+def qc_rank(x, x_hist=None, x_sorted=None):
+  """ Rank in historical performances, as "position/total"
+
+  x_sorted are the sorted historical values without NaN, computed if not given.
+  The position is the (average, for ties) rank of x in descending order.
+  """
+  if x_sorted is None:
+    x_hist = np.asarray(x_hist, dtype=float)
+    x_sorted = np.sort(x_hist[~np.isnan(x_hist)])
+  greater, equal = count_greater_equal(x, x_sorted)
+  x_pos = int(np.floor(greater + 1 + equal / 2))
+  return '{}/{}'.format(x_pos, len(x_sorted) + 1)
+
+
+def qc_allmetrics(pro_dt, meta_dt, pep_dt=None, output_dir=None, workers=1):
+  """ Calculating all QC metrics
+
+  Returns a dict with the SNR results, the RC results (None without
+  peptide level data) and the table of the metric values. `workers` is
+  the number of sample pairs analysed in parallel for RC.
+  """
+  # Basic information
+  with time_stage('qc_info'):
+    pro_info = qc_info(pro_dt, meta_dt)
+
+  # SNR
+  with time_stage('qc_snr'):
+    snr_results = qc_snr(pro_dt, meta_dt, output_dir)
+  snr_value = snr_results['SNR']
+
+  # RC
+  if pep_dt is not None:
+    with time_stage('qc_cor'):
+      cor_results = qc_cor(pep_dt, meta_dt, output_dir, workers)
+    cor_value = cor_results['COR']
+  else:
+    cor_results = None
+    cor_value = np.nan
+
+  output_table = pd.DataFrame({
+    'Quality Metrics': METRICS,
+    'Value': np.array(pro_info + [snr_value, cor_value], dtype=float)
+  })
+
+  return {
+    'snr_results': snr_results,
+    'cor_results': cor_results,
+    'output_table': output_table
+  }
+
+
+def qc_total(allmetrics_dt, ref_qc, ref_qc_norm, ref_qc_stat, index=None):
+  """ Calculating: Total Score
+
+  Returns a dict with the normalized values (Normalized) and the conclusion
+  table with the historical values, ranks and performances (Raw). `index`
+  is the baseline_index of ref_qc and ref_qc_norm, built if not given.
+  """
+  if index is None:
+    index = baseline_index(ref_qc, ref_qc_norm)
+
+  # Normalize & Rank: All metrics
+  output_norm = []
+  output_rank = []
+  output_class = []
+  metrics = allmetrics_dt['Quality Metrics'].tolist()
+  for m, x in zip(metrics, allmetrics_dt['Value']):
+    ref = index[m]
+
+    if not np.isnan(x):
+      x_norm = qc_linear_norm(x, ref['min'], ref['max'], decreasing=m in DECREASING_METRICS)
+      x_rank = qc_rank(x_norm, x_sorted=ref['sorted'])
+      x_class = qc_performance(x_norm, ref_perc=ref['cutoffs'])
+    else:
+      x_norm = np.nan
+      x_rank = np.nan
+      x_class = np.nan
+
+    output_norm.append(x_norm)
+    output_rank.append(x_rank)
+    output_class.append(x_class)
+
+  # Normalize & Rank: Total score, the geometric mean of the normalized values
+  total = index['Total']
+  norms = np.array(output_norm, dtype=float)
+  total_value = r_round(np.exp(np.mean(np.log(norms[~np.isnan(norms)]))), 3)
+  total_norm = qc_linear_norm(total_value, total['min'], total['max'])
+
+  total_rank = qc_rank(total_norm, x_sorted=total['sorted'])
+  total_c = qc_performance(total_norm, ref_perc=total['cutoffs'])
+
+  # Output
+  allnorm_dt = pd.DataFrame({
+    'Quality Metrics': metrics + ['Total', 'Total_norm'],
+    'Value': output_norm + [total_value, total_norm]
+  })
+  allmetrics_dt = pd.concat([
+    allmetrics_dt,
+    pd.DataFrame({'Quality Metrics': ['Total Score'], 'Value': [total_norm]})
+  ], ignore_index=True)
+  output_table = allmetrics_dt.merge(ref_qc_stat, on='Quality Metrics')
+  output_table = output_table.sort_values('Quality Metrics', kind='stable').reset_index(drop=True)
+  output_table = output_table.iloc[[3, 2, 0, 1, 5, 4, 6]].reset_index(drop=True)
+  output_table['Rank'] = output_rank + [total_rank]
+  output_table['Performance'] = output_class + [total_c]
+
+  return {'Normalized': allnorm_dt, 'Raw': output_table}
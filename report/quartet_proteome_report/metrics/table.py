@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+""" Read and write tables the way protqc (data.table::fread / write.table) does """
+
+import csv
+import logging
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+# write.table prints numbers with 15 significant digits (DBL_DIG)
+R_DIGITS = 15
+
+
+def format_number(x, digits=R_DIGITS):
+  """ Format a number like R's formatReal: the shortest of the fixed
+  and the scientific notation with up to `digits` significant digits.
+  With `digits` set to None, the shortest exact representation is used. """
+  if x is None or (isinstance(x, float) and math.isnan(x)):
+    return 'NA'
+  if isinstance(x, (bool, np.bool_)):
+    return 'TRUE' if x else 'FALSE'
+  if isinstance(x, (int, np.integer)):
+    return str(int(x))
+  x = float(x)
+  if math.isinf(x):
+    return 'Inf' if x > 0 else '-Inf'
+  if x == 0:
+    return '0'
+  if digits is None:
+    return repr(x)
+
+  mantissa, exponent = ('%.*e' % (digits - 1, x)).split('e')
+  exponent = int(exponent)
+  nsig = max(len(mantissa.lstrip('-').replace('.', '').rstrip('0')), 1)
+  neg = 1 if x < 0 else 0
+
+  sci_width = neg + nsig + (1 if nsig > 1 else 0) + (4 if abs(exponent) < 100 else 5)
+  rgt = max(0, nsig - exponent - 1)
+  if exponent >= 0:
+    fixed_width = neg + exponent + 1 + (rgt + 1 if rgt > 0 else 0)
+  else:
+    fixed_width = neg + 2 + rgt
+
+  if fixed_width <= sci_width:
+    return '%.*f' % (rgt, x)
+  return '%.*e' % (nsig - 1, x)
+
+
+def format_string(x):
+  """ Quote a string like write.table(qmethod = "escape") """
+  if x is None or (isinstance(x, float) and math.isnan(x)):
+    return 'NA'
+  return '"%s"' % str(x).replace('"', '\\"')
+
+
+def format_column(column, digits=R_DIGITS):
+  if pd.api.types.is_bool_dtype(column) or pd.api.types.is_numeric_dtype(column):
+    return [format_number(x, digits) for x in column.tolist()]
+  return [format_string(x) for x in column.tolist()]
+
+
+def write_table(df, path, digits=R_DIGITS):
+  """ Write a DataFrame like write.table(df, path, sep = "\\t", row.names = F) """
+  columns = [format_column(df[c], digits) for c in df.columns]
+  lines = ['\t'.join(format_string(c) for c in df.columns)]
+  lines.extend('\t'.join(row) for row in zip(*columns))
+  with open(path, 'w', encoding='utf-8') as f:
+    f.write('\n'.join(lines) + '\n')
+
+
+def write_result_table(df, output_dir, name):
+  """ Write a result table as name.tsv, or as name.feather (Arrow IPC) when the
+  PROTQC_OUTPUT_FORMAT environment variable is feather and pyarrow is installed """
+  if os.environ.get('PROTQC_OUTPUT_FORMAT', 'tsv') == 'feather':
+    try:
+      df.reset_index(drop=True).to_feather(os.path.join(output_dir, name + '.feather'))
+      return
+    except ImportError:
+      log.warning('pyarrow is not installed, {} is written as TSV.'.format(name))
+  write_table(df, os.path.join(output_dir, name + '.tsv'))
+
+
+def read_header(path):
+  """ The separator and the column names of a delimited file, like fread on the first line
+
+  The names are kept as they are, duplicated ones included.
+  """
+  with open(path, 'r', encoding='utf-8', newline='') as f:
+    header = f.readline().rstrip('\r\n')
+  sep = '\t' if header.count('\t') >= header.count(',') and '\t' in header else ','
+  return sep, next(csv.reader([header], delimiter=sep))
+
+
+def read_delim(path, text_columns=()):
+  """ Read a comma or tab separated file, the separator is detected from the header like fread """
+  sep, _ = read_header(path)
+  dtype = {c: str for c in text_columns}
+  return pd.read_csv(path, sep=sep, dtype=dtype, keep_default_na=True)
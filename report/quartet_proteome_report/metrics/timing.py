@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+""" Stage timings of qc_conclusion, written to stage_timings.tsv like protqc does """
+
+import re
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Stage timings of the current qc_conclusion call
+_stages = []
+
+
+def reset_timings():
+  """ Reset the stage timings and the peak memory of the process """
+  _stages.clear()
+  # Resets VmHWM on Linux, so that a reused process reports the peak of each job only
+  try:
+    with open('/proc/self/clear_refs', 'w') as f:
+      f.write('5')
+  except OSError:
+    pass
+
+
+def peak_rss():
+  """ Peak resident memory of the process in MB (VmHWM), NaN if unknown """
+  try:
+    with open('/proc/self/status') as f:
+      hwm = re.search(r'^VmHWM:\s*(\d+)', f.read(), re.M)
+  except OSError:
+    hwm = None
+  return round(int(hwm.group(1)) / 1024, 1) if hwm else float('nan')
+
+
+@contextmanager
+def time_stage(stage):
+  """ Record the wall time of the block and the peak memory """
+  start = time.perf_counter()
+  yield
+  _stages.append({'stage': stage, 'seconds': round(time.perf_counter() - start, 3), 'peak_rss_mb': peak_rss()})
+
+
+def write_timings(path):
+  """ Write the stage timings to a TSV file """
+  if _stages:
+    pd.DataFrame(_stages, columns=['stage', 'seconds', 'peak_rss_mb']).to_csv(
+      path, sep='\t', index=False, na_rep='NA')
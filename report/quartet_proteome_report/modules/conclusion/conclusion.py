@@ -5,20 +5,50 @@
 from __future__ import print_function
 from collections import OrderedDict
 import logging
-from string import printable
-import pandas as pd
-import numpy as np
 import os
 
 from multiqc import config
 from multiqc.plots import table, heatmap
 from multiqc.modules.base_module import BaseMultiqcModule
-from quartet_proteome_report.modules.plotly import plot as plotly_plot
+from quartet_proteome_report.utils.results import get_results
 
 
 # Initialise the main MultiQC logger
 log = logging.getLogger('multiqc')
 
+
+def compact_quality_score(quality_score_df, bins):
+  """ The queried data and the historical batches binned by total score percentile,
+  each bin shows the median scores of its batches. The rows are sorted by total score. """
+  import numpy as np
+  import pandas as pd
+
+  queried = quality_score_df['Batch'] == 'Queried_Data'
+  history = quality_score_df[~queried]
+  bins = min(bins, len(history))
+  bin_index = np.arange(len(history)) * bins // len(history)
+  binned = history.drop(columns=['Batch']).groupby(bin_index).median()
+  counts = np.bincount(bin_index, minlength=bins)
+  lower = np.concatenate([[0], np.cumsum(counts)[:-1]]) * 100 // len(history)
+  upper = np.cumsum(counts) * 100 // len(history)
+  labels = 'P' + pd.Series(lower).astype(str) + '-' + pd.Series(upper).astype(str) + \
+    ' (n=' + pd.Series(counts).astype(str) + ')'
+  binned.insert(0, 'Batch', labels.to_numpy())
+
+  # The queried data goes before the bin of the first historical batch scoring higher
+  lower_batches = int(np.argmax(queried.to_numpy()))
+  position = bins if lower_batches >= len(history) else bin_index[lower_batches]
+  return pd.concat([binned.iloc[:position], quality_score_df[queried], binned.iloc[position:]], ignore_index=True)
+
+
+def heatmap_scores(quality_score_df, score_config):
+  """ (compact, rows of the Performance Score heatmap): the batches as they are, or binned
+  above score_heatmap_max_batches historical batches """
+  if len(quality_score_df) - 1 > score_config['score_heatmap_max_batches']:
+    return True, compact_quality_score(quality_score_df, score_config['score_heatmap_bins'])
+  return False, quality_score_df
+
+
 class MultiqcModule(BaseMultiqcModule):
   def __init__(self):
     
@@ -37,22 +67,25 @@ class MultiqcModule(BaseMultiqcModule):
         )
     }
 
+    results = get_results()
+    # Nothing to plot (e.g. an empty run): pandas is not even imported
+    if not any(results.has(k) for k in ['conclusion/cutoff_table', 'conclusion/conclusion_table', 'conclusion/rank_table']):
+      log.debug('No file matched: conclusion')
+      return None
+
     ### Cutoff Table
-    cutoff_table = pd.DataFrame()
-    for f in self.find_log_files('conclusion/cutoff_table'):
-      f_p = '%s/%s' % (f['root'], f['fn'])
-      cutoff_table = pd.read_csv(f_p, sep = "\t")
+    cutoff_table = results.table('conclusion/cutoff_table')
     if cutoff_table.empty:
       log.debug('No file matched: conclusion - cutoff_table.tsv')
 
 
     ### Conclusion Table
     table_summary_dic = {}
-    for f in self.find_log_files('conclusion/conclusion_table'):
-      f_p = '%s/%s' % (f['root'], f['fn'])
-      content = pd.read_csv(f_p, sep = "\t").replace(r'\\u00b1', '±', regex=True)
+    content = results.table('conclusion/conclusion_table')
+    if not content.empty:
+      content = content.replace(r'\\u00b1', '±', regex=True)
       content.columns = ['Quality Metrics', 'Value', 'Historical Value (mean ± SD)', 'Rank', 'Performance']
-      table_summary_dic = content.set_index('Quality Metrics').T.to_dict()
+      table_summary_dic = content.set_index('Quality Metrics').to_dict('index')
     if len(table_summary_dic) != 0:
       self.plot_summary_table('conclusion_summary', table_summary_dic, cutoff_table)
     else:
@@ -60,10 +93,8 @@ class MultiqcModule(BaseMultiqcModule):
 
 
     ### Performance Score
-    quality_score_df = pd.DataFrame()
-    for f in self.find_log_files('conclusion/rank_table'):
-      f_p = '%s/%s' % (f['root'], f['fn'])
-      quality_score_df = pd.read_csv(f_p, sep = "\t")
+    quality_score_df = results.table('conclusion/rank_table')
+    if not quality_score_df.empty:
       # Sort the dataframe by total score
       quality_score_df.sort_values('Total', inplace=True, ascending=True)
     if quality_score_df.shape[0] != 0:
@@ -209,7 +240,15 @@ class MultiqcModule(BaseMultiqcModule):
     metrics = ["Batch", "Absolute Correlation", "Coefficient of variantion (CV, %)", "Missing percentage (%)", "Number of features", "Relative Correlation with Reference Datasets (RC)", "Signal-to-Noise Ratio (SNR)", "Total_norm"]
     metrics[-1] = 'Total Score'
     quality_score_df.columns = metrics
-    final_data = quality_score_df[metrics[1:]].T.values.tolist()
+
+    # Compact mode: too many historical batches to show one column each
+    compact, heatmap_df = heatmap_scores(quality_score_df, config.quartet_proteome_report)
+    if compact:
+      # All the batches are still in the data directory of the report
+      self.write_data_file(quality_score_df.set_index('Batch').to_dict('index'), 'quartet_performance_score')
+    quality_score_df = heatmap_df
+
+    final_data = quality_score_df[metrics[1:]].to_numpy().T
     final_xcats = quality_score_df['Batch'].to_list()
     final_ycats = metrics[1:]
     
@@ -224,13 +263,17 @@ class MultiqcModule(BaseMultiqcModule):
       "height": 251,
       "borderWidth": 0
     }
+
+    description = '''
+      Scores of evaluation metrics for the current batch and all historical batches assessed.<br>Please note that the results shown here are <span style="background-color: transparent;font-weight:bold;">scaled values</span> for all batches in each metric. The name of your data is <span style="background-color: transparent;font-weight:bold;">Queried_Data</span>. The white colour block means a <span style="background-color: transparent;font-weight:bold;">NULL</span> value, although 0.00 is shown.
+      '''
+    if compact:
+      description += '''<br>The historical batches are grouped by the percentile of their total score (e.g. P0-5 are the lowest 5%), each group shows the median scores of its batches. The scores of every batch are in quartet_performance_score of the report data.
+      '''
     
     self.add_section(
       name="Performance Score",
       anchor= id + '_anchor',
-      description='''
-      Scores of evaluation metrics for the current batch and all historical batches assessed.<br>Please note that the results shown here are <span style="background-color: transparent;font-weight:bold;">scaled values</span> for all batches in each metric. The name of your data is <span style="background-color: transparent;font-weight:bold;">Queried_Data</span>. The white colour block means a <span style="background-color: transparent;font-weight:bold;">NULL</span> value, although 0.00 is shown.
-      ''',
+      description=description,
       plot=heatmap.plot(final_data, final_xcats, final_ycats, pconfig),
     )
-
@@ -3,23 +3,51 @@
 """ Quartet Proteomics Report plugin module """
 
 from __future__ import print_function
-from collections import OrderedDict
 import logging
-from typing import List
-import pandas as pd
-import math
 
 from multiqc import config
-from multiqc.plots import scatter
 from multiqc.modules.base_module import BaseMultiqcModule
-import plotly.express as px
-import plotly.figure_factory as ff
 from quartet_proteome_report.utils.plotly import plot as plotly_plot
+from quartet_proteome_report.utils.results import get_results
 
 
 # Initialise the main MultiQC logger
 log = logging.getLogger('multiqc')
 
+
+def thin_points(fig_data, tick, bins, points_per_bin, outlier_mad, seed=0):
+  """ Keep a random sample of at most `points_per_bin` points per grid cell and
+  sample pair, so that dense cells are thinned and sparse cells are kept whole.
+  Outliers (by robust residual) are always kept. The sample is seeded: a report
+  shows the same points every time it is rendered. """
+  import numpy as np
+  import pandas as pd
+
+  cell_size = 2 * tick / bins if tick > 0 else 1
+  cell_x = np.floor((fig_data['logFC.Test'] + tick) / cell_size).fillna(-1).astype(int)
+  cell_y = np.floor((fig_data['logFC.Reference'] + tick) / cell_size).fillna(-1).astype(int)
+  # The rank of a random key picks a uniform sample in each cell, not the first rows of the file
+  key = pd.Series(np.random.default_rng(seed).random(len(fig_data)), index=fig_data.index)
+  rank_in_cell = key.groupby([fig_data['Sample.Pair'], cell_x, cell_y]).rank(method='first')
+
+  residual = fig_data['logFC.Test'] - fig_data['logFC.Reference']
+  deviation = (residual - residual.groupby(fig_data['Sample.Pair']).transform('median')).abs()
+  mad = deviation.groupby(fig_data['Sample.Pair']).transform('median') * 1.4826
+  outlier = deviation > outlier_mad * mad
+
+  return fig_data[(rank_in_cell <= points_per_bin) | outlier]
+
+
+def scatter_points(fig_data, tick, rc_config):
+  """ The points of the RC scatter, thinned out above rc_scatter_webgl_threshold """
+  if fig_data.shape[0] <= rc_config['rc_scatter_webgl_threshold']:
+    return fig_data
+  return thin_points(fig_data, tick,
+                     bins = rc_config['rc_scatter_bins'],
+                     points_per_bin = rc_config['rc_scatter_points_per_bin'],
+                     outlier_mad = rc_config['rc_scatter_outlier_mad'])
+
+
 class MultiqcModule(BaseMultiqcModule):
   def __init__(self):
         
@@ -33,38 +61,44 @@ class MultiqcModule(BaseMultiqcModule):
     )
     
     # Find and load any input files for correlation
-    corr_df = pd.DataFrame()
-    for f in self.find_log_files('correlation/table'):
-      f_p = '%s/%s' % (f['root'], f['fn'])
+    results = get_results()
+    corr_df = results.table('correlation/table') if results.has('correlation/table') else None
 
-      corr_df = pd.read_csv(f_p, sep = "\t")
-    
     # Now add a Scatter plot
-    if len(corr_df) != 0:
+    if corr_df is not None and len(corr_df) != 0:
       self.plot_rc("correlation-scatter", corr_df)
     else:
       log.debug('No file matched: correlation - corr_table.tsv')
   
   ### Function: Plot the scatter plot
   def plot_rc(self, id, fig_data, title=None, section_name=None, description=None, helptext=None):
+    # Only imported when there is something to plot
+    import plotly.express as px
+
+    rc_config = config.quartet_proteome_report
     fig_data = fig_data[['logFC.Test', 'Sample.Pair', 'logFC.Reference', "Sequence"]]
-    fig_data.sort_values('Sample.Pair', inplace=True, ascending=True)
-    fig_data['logFC.Test'] = fig_data['logFC.Test'].map(lambda x: ('%.3f') % x)
-    fig_data['logFC.Reference'] = fig_data['logFC.Reference'].map(lambda x: ('%.3f') % x)
-    
-    fig_data[['logFC.Test', 'logFC.Reference']] = fig_data[['logFC.Test', 'logFC.Reference']].astype('float')
+    fig_data = fig_data.sort_values('Sample.Pair', ascending=True)
+    fig_data[['logFC.Test', 'logFC.Reference']] = fig_data[['logFC.Test', 'logFC.Reference']].astype('float').round(3)
+
     min_value = min([fig_data['logFC.Test'].min(), fig_data['logFC.Reference'].min()])
     max_value = max([fig_data['logFC.Test'].max(), fig_data['logFC.Reference'].max()])
     
     tick = max(abs(min_value), abs(max_value))
 
+    # Large-data mode: WebGL rendering with the overlapping points thinned out
+    total_num = fig_data.shape[0]
+    large_data = total_num > rc_config['rc_scatter_webgl_threshold']
+    fig_data = scatter_points(fig_data, tick, rc_config)
+    if large_data:
+      log.info('Correlation scatter: {} of {} points shown in large-data mode'.format(fig_data.shape[0], total_num))
+
     fig = px.scatter(fig_data, 
           x = 'logFC.Test', y = 'logFC.Reference',
           title = title, 
           color = 'Sample.Pair',
           color_discrete_map={"D5/D6": "#00ACC6", "F7/D6": "#FFB132", "M8/D6": "#E8633B"},
           hover_data={'logFC.Test': ':.3f', 'logFC.Reference': ':.3f', 'Sequence': True},
-          render_mode = 'svg')
+          render_mode = 'webgl' if large_data else 'svg')
     
     fig.update_traces(marker=dict(size=10, opacity=0.5))
     fig.update_layout(yaxis_title='logFC.Test',
@@ -83,12 +117,18 @@ class MultiqcModule(BaseMultiqcModule):
           'auto_margin': False
           })
     
+    description = """
+        Relative correlation with reference datasets metric which was representing the numerical consistency of the relative expression profiles.
+        """
+    if large_data:
+      description += """
+        <br>{} of {} peptides are shown: overlapping points were thinned out, outliers are kept.
+        """.format(fig_data.shape[0], total_num)
+
     # Add a report section with the scatter plot
     self.add_section(
         name="",
-        description="""
-        Relative correlation with reference datasets metric which was representing the numerical consistency of the relative expression profiles.
-        """,
+        description=description,
         anchor="correlation-scatter",
         plot = html
     )
@@ -6,6 +6,7 @@ from __future__ import print_function
 import logging
 from multiqc import config
 from multiqc.modules.base_module import BaseMultiqcModule
+from quartet_proteome_report.utils.results import get_results
 
 # Initialise the main MultiQC logger
 log = logging.getLogger('multiqc')
@@ -25,9 +26,7 @@ class MultiqcModule(BaseMultiqcModule):
     )
     
     # Find and load any input files for general_information
-    information = []
-    for f in self.find_log_files('general_information/information'):
-      information = eval(f['f'])
+    information = get_results().dict('general_information/information')
     
     if len(information) != 0:
       self.plot_information('general_information', information)
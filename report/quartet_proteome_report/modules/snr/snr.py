@@ -3,17 +3,12 @@
 """ Quartet Proteomics Report plugin module """
 
 from __future__ import print_function
-from collections import OrderedDict
 import logging
-from typing import List
-import pandas as pd
 
 from multiqc import config
-from multiqc.plots import scatter
 from multiqc.modules.base_module import BaseMultiqcModule
-import plotly.express as px
-import plotly.figure_factory as ff
 from quartet_proteome_report.utils.plotly import plot as plotly_plot
+from quartet_proteome_report.utils.results import get_results
 
 # Initialise the main MultiQC logger
 log = logging.getLogger('multiqc')
@@ -30,23 +25,22 @@ class MultiqcModule(BaseMultiqcModule):
       name='Signal-to-Noise Ratio'
     )
     
-    snr_pca_df = pd.DataFrame()
-    for f in self.find_log_files('snr/table'):
-      f_p = '%s/%s' % (f['root'], f['fn'])
-      snr_pca_df = pd.read_csv(f_p, sep = "\t")
-    
+    results = get_results()
+    snr_pca_df = results.table('snr/table') if results.has('snr/table') else None
+
     # Now add a PCA plot
-    if len(snr_pca_df) != 0:
+    if snr_pca_df is not None and len(snr_pca_df) != 0:
       self.plot_pca("snr-pca", snr_pca_df)
     else:
       log.debug('No file matched: snr - pca_table.txt')
   
   ### Function: Plot the scatter plot
   def plot_pca(self, id, fig_data, title=None, section_name=None, description=None, helptext=None):
-    
-    fig_data = fig_data[["sample_id", "sample", "PC1", "PC2"]]
-    fig_data['PC1'] = fig_data['PC1'].map(lambda x: ('%.3f') % x)
-    fig_data['PC2'] = fig_data['PC2'].map(lambda x: ('%.3f') % x)
+    # Only imported when there is something to plot
+    import plotly.express as px
+
+    fig_data = fig_data[["sample_id", "sample", "PC1", "PC2"]].copy()
+    fig_data[['PC1', 'PC2']] = fig_data[['PC1', 'PC2']].astype('float').round(3)
 
     fig = px.scatter(fig_data, 
           x = 'PC1', y = 'PC2',
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+""" A MultiQC render service for the Quartet Proteomics reports
+
+python -m quartet_proteome_report.service [-p PORT]
+
+MultiQC, the plugin modules and the report template are imported once, a
+report only costs the render itself. The service listens on localhost and
+prints "READY <PORT>" on stdout once it accepts requests (-p 0 picks a free port),
+the logs go to stderr.
+
+  POST /render  {"analysis_dir": ..., "outdir": ..., "title": ..., "comment": ...,
+                 "filename": ..., "template": ..., "config": ..., "dirs": false}
+                -> {"status": "Success" | "Error", "msg": ...}
+  GET  /ping    -> {"status": "OK"}
+
+Every request is handled in a child forked from the accept loop of the
+service: MultiQC keeps the state of a run in module globals, each child starts
+from the same warm state. The service has a single thread, a child never
+inherits a lock held by another thread.
+"""
+
+import json
+import logging
+import os
+import socketserver
+import sys
+import traceback
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import click
+
+log = logging.getLogger(__name__)
+
+# Options of a render request, see multiqc.run
+RENDER_DEFAULTS = {
+  'title': 'Quartet Report for Proteomics',
+  'comment': '',
+  'filename': 'multiqc_report.html',
+  'template': 'report_templates',
+  'config': None,
+  'dirs': False
+}
+
+
+def preload():
+  """ Import MultiQC and everything a report of the plugin needs """
+  from multiqc import multiqc
+  from multiqc.utils import config
+  from quartet_proteome_report import custom_code
+  from quartet_proteome_report.modules import conclusion, correlation, general_information, snr, supplementary
+  from quartet_proteome_report.templates import default
+  # Imported by the modules once they have data to plot, not worth deferring here.
+  # plotly loads its figure classes on first use: build one.
+  import numpy, pandas, plotly.express
+  plotly.express.scatter(pandas.DataFrame({'x': [0.0], 'y': [0.0], 'c': ['a']}), x='x', y='y', color='c').to_plotly_json()
+  # The entry points of the modules & the template are resolved once too
+  for entry_point in list(config.avail_modules.values()) + [config.avail_templates['report_templates']]:
+    entry_point.load()
+  # Not once per report
+  config.no_version_check = True
+  return multiqc
+
+
+def render(multiqc, request):
+  """ Render one report, in a forked child, returns {"status": ..., "msg": ...} """
+  try:
+    options = dict(RENDER_DEFAULTS, **request)
+    result = multiqc.run(
+      request['analysis_dir'],
+      outdir=request['outdir'],
+      title=options['title'],
+      report_comment=options['comment'],
+      filename=options['filename'],
+      template=options['template'],
+      config_file=(options['config'],) if options['config'] else (),
+      dirs=options['dirs'],
+      force=True,
+      kwargs={'disable_plugin': False}
+    )
+    status = 'Success' if result['sys_exit_code'] == 0 else 'Error'
+    return {'status': status, 'msg': '' if status == 'Success' else 'MultiQC exited with {}.'.format(result['sys_exit_code'])}
+  except SystemExit as e:
+    return {'status': 'Error', 'msg': 'MultiQC exited with {}.'.format(e.code)}
+  except Exception:
+    return {'status': 'Error', 'msg': traceback.format_exc()}
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+
+  def reply(self, code, body):
+    data = json.dumps(body).encode('utf-8')
+    self.send_response(code)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
+
+  def do_GET(self):
+    if self.path == '/ping':
+      self.reply(200, {'status': 'OK'})
+    else:
+      self.reply(404, {'status': 'Error', 'msg': 'Not found'})
+
+  def do_POST(self):
+    if self.path != '/render':
+      self.reply(404, {'status': 'Error', 'msg': 'Not found'})
+      return
+    try:
+      request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+      if not request.get('analysis_dir') or not request.get('outdir'):
+        raise ValueError('analysis_dir and outdir are required.')
+      if not os.path.isdir(request['analysis_dir']):
+        raise ValueError('{} is not a directory.'.format(request['analysis_dir']))
+    except ValueError as e:
+      self.reply(400, {'status': 'Error', 'msg': str(e)})
+      return
+
+    result = render(self.server.multiqc, request)
+    log.info('Rendered {} into {}: {}'.format(request['analysis_dir'], request['outdir'], result['status']))
+    self.reply(200, result)
+
+  def log_message(self, format, *args):
+    log.debug(format % args)
+
+
+class RenderServer(socketserver.ForkingMixIn, HTTPServer):
+  """ Handle every request in a child forked from the accept loop """
+
+
+@click.command()
+@click.option('-p', '--port', default=0, show_default=True, type=click.IntRange(min=0),
+              help='The port to listen on (localhost), 0 picks a free one.')
+def main(port):
+  """ Serve the rendering of MultiQC reports """
+  logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+  server = RenderServer(('127.0.0.1', port), RenderHandler)
+  server.multiqc = preload()
+  print('READY {}'.format(server.server_address[1]), flush=True)
+  # Nobody reads stdout after READY, MultiQC writes to stderr instead
+  os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+
+
+if __name__ == '__main__':
+  main()
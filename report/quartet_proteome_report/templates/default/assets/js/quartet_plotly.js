@@ -0,0 +1,111 @@
+////////////////////////////////////////////////
+// Plotly figures of the Quartet report
+////////////////////////////////////////////////
+
+// Typed arrays written by quartet_proteome_report/utils/plotly.py
+var quartet_plotly_dtypes = {
+  f4: Float32Array,
+  f8: Float64Array,
+  i4: Int32Array
+};
+
+// Cache of the parsed layout templates, shared by all figures
+var quartet_plotly_templates = {};
+
+// Decode a base64 typed array into a plain array
+function quartet_plotly_decode_array(obj) {
+  var binary = window.atob(obj.bdata);
+  var bytes = new Uint8Array(binary.length);
+  for (var i = 0; i < binary.length; i++) {
+    bytes[i] = binary.charCodeAt(i);
+  }
+  return Array.prototype.slice.call(new quartet_plotly_dtypes[obj.dtype](bytes.buffer));
+}
+
+// Recursively replace the typed arrays in a figure object
+function quartet_plotly_decode(obj) {
+  if (Array.isArray(obj)) {
+    for (var i = 0; i < obj.length; i++) {
+      obj[i] = quartet_plotly_decode(obj[i]);
+    }
+  } else if (obj !== null && typeof obj === "object") {
+    if (typeof obj.bdata === "string" && quartet_plotly_dtypes[obj.dtype] !== undefined) {
+      return quartet_plotly_decode_array(obj);
+    }
+    for (var key in obj) {
+      obj[key] = quartet_plotly_decode(obj[key]);
+    }
+  }
+  return obj;
+}
+
+// Load a figure from its JSON script tag and attach the shared template
+function quartet_plotly_figure(data_id) {
+  var figure = quartet_plotly_decode(JSON.parse($("#" + data_id).html()));
+  if (figure.template) {
+    if (quartet_plotly_templates[figure.template] === undefined) {
+      quartet_plotly_templates[figure.template] = JSON.parse($("#" + figure.template).html());
+    }
+    figure.layout.template = quartet_plotly_templates[figure.template];
+  }
+  return figure;
+}
+
+// Figures waiting to be rendered: plot element id -> data element id
+var quartet_plotly_pending = {};
+
+// Register a figure, it is rendered once its section scrolls into view
+function quartet_plotly_register(id, data_id) {
+  quartet_plotly_pending[id] = data_id;
+}
+
+function quartet_plotly_render(id) {
+  var data_id = quartet_plotly_pending[id];
+  if (data_id === undefined) {
+    return;
+  }
+  delete quartet_plotly_pending[id];
+
+  var figure = quartet_plotly_figure(data_id);
+  figure.layout.autosize = true;
+  Plotly.newPlot(id, figure.data, figure.layout);
+
+  // When plotly is working, hide something
+  $("#" + id).removeClass("not_rendered");
+  $("#" + id + " small").hide();
+}
+
+// Render the figures lazily, after the page (and plotly.js at its bottom) has loaded
+$(function () {
+  var ids = Object.keys(quartet_plotly_pending);
+  if (!("IntersectionObserver" in window)) {
+    ids.forEach(quartet_plotly_render);
+    return;
+  }
+  var observer = new IntersectionObserver(function (entries) {
+    entries.forEach(function (entry) {
+      if (entry.isIntersecting) {
+        observer.unobserve(entry.target);
+        quartet_plotly_render(entry.target.id);
+      }
+    });
+  }, { rootMargin: "200px 0px" });
+  ids.forEach(function (id) {
+    observer.observe(document.getElementById(id));
+  });
+});
+
+// One debounced resize handler shared by all figures:
+// update the layout to expand to the available size
+var quartet_plotly_resize_timer = null;
+$(window).on("resize", function () {
+  clearTimeout(quartet_plotly_resize_timer);
+  quartet_plotly_resize_timer = setTimeout(function () {
+    $(".js-plotly-plot").each(function () {
+      Plotly.relayout(this, {
+        "xaxis.autorange": true,
+        "yaxis.autorange": true
+      });
+    });
+  }, 150);
+});
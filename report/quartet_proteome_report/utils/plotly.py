@@ -1,15 +1,93 @@
 #!/usr/bin/env python
-""" MultiQC functions to use plotly library """
+""" MultiQC functions to use plotly library
+
+Figures are embedded as JSON. The layout template (e.g. plotly_white) is
+written once per report and each figure only keeps a reference to it.
+Numeric arrays are written as base64 encoded typed arrays, which are
+decoded by assets/js/quartet_plotly.js in the report template. That script
+also renders the figures lazily, plotly.js is bundled with the template.
+
+numpy and plotly are only imported once a figure is plotted, the plugin
+hooks import this module on every MultiQC run.
+"""
 
-import logging
 import base64
-from plotly.io import to_json
-from multiqc.utils import report
+import hashlib
+import json
+import logging
 
 logger = logging.getLogger(__name__)
 
+# Typed array encoding: numpy dtype -> dtype name understood by quartet_plotly.js
+FLOAT_DTYPE = ('<f4', 'f4')
+INT_DTYPE = ('<i4', 'i4')
+# Shorter arrays are left as JSON text, the base64 overhead is not worth it
+MIN_ENCODED_LENGTH = 8
+
+# Templates already written to the current report
+_written_templates = set()
+
+
+def reset_templates():
+    """ Forget the written templates, called once at the start of every report """
+    _written_templates.clear()
+
+
+def encode_array(values):
+    """ Encode a 1-D numeric array as a base64 typed array, other values are returned unchanged """
+    import numpy as np
+
+    if isinstance(values, (list, tuple)):
+        numbers = [v for v in values if v is not None]
+        if len(values) < MIN_ENCODED_LENGTH or not numbers or \
+                not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in numbers):
+            return values
+        # None (a gap for plotly) is encoded as NaN, the same gap
+        values = np.asarray(values, dtype=float if len(numbers) < len(values) else None)
+    elif not isinstance(values, np.ndarray):
+        return values
+
+    if values.ndim != 1 or values.size < MIN_ENCODED_LENGTH:
+        return values
+    if np.issubdtype(values.dtype, np.integer) and \
+            values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max:
+        dtype, name = INT_DTYPE
+    elif np.issubdtype(values.dtype, np.floating):
+        dtype, name = FLOAT_DTYPE
+    else:
+        return values
+
+    bdata = base64.b64encode(values.astype(dtype).tobytes()).decode('ascii')
+    return {'dtype': name, 'bdata': bdata}
+
+
+def encode_arrays(obj):
+    """ Recursively encode the numeric arrays of a figure dict """
+    if isinstance(obj, dict):
+        return {k: encode_arrays(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)) and any(isinstance(v, (dict, list, tuple)) for v in obj):
+        return [encode_arrays(v) for v in obj]
+    return encode_array(obj)
+
+
+def template_to_html(template):
+    """ Return the template id and the HTML for the template, empty if already written """
+    from plotly.utils import PlotlyJSONEncoder
+
+    json_str = json.dumps(template, cls=PlotlyJSONEncoder, sort_keys=True)
+    template_id = 'plotly_template_' + hashlib.sha1(json_str.encode('utf-8')).hexdigest()[:12]
+    if template_id in _written_templates:
+        return template_id, ''
+
+    _written_templates.add(template_id)
+    html = '<script id="{id}" type="text/json">{json}</script>'.format(
+        id=template_id, json=json_str)
+    return template_id, html
+
 
 def fig_to_json_html(fig, pconfig):
+    from plotly.utils import PlotlyJSONEncoder
+
     if pconfig.get('auto_margin'):
         fig.update_layout(margin=dict(l=40, r=20, t=40, b=40))
 
@@ -22,16 +100,29 @@ def fig_to_json_html(fig, pconfig):
     if pconfig.get('title'):
         fig.update_layout(title_text=pconfig['title'], title_x=0.5)
 
-    json_str = to_json(fig)
-    html = '<script id="{id}" type="text/json">{json}</script>'.format(
-        id=pconfig['data_id'], json=json_str)
+    figure = fig.to_plotly_json()
+    layout = dict(figure.get('layout', {}))
+    template = layout.pop('template', None)
+
+    template_html = ''
+    template_id = None
+    if template:
+        template_id, template_html = template_to_html(template)
+
+    figure = {
+        'data': encode_arrays(figure.get('data', [])),
+        'layout': encode_arrays(layout),
+        'template': template_id
+    }
+    json_str = json.dumps(figure, cls=PlotlyJSONEncoder)
+    html = '{template_html}<script id="{id}" type="text/json">{json}</script>'.format(
+        template_html=template_html, id=pconfig['data_id'], json=json_str)
     return html
 
 
 def plot(fig, pconfig):
     data_html = fig_to_json_html(fig, pconfig)
     html = '''
-  <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>
   <div class="hc-plot-wrapper">
     <div id="{id}" class="hc-plot not_rendered">
       <small>loading..</small>
@@ -39,23 +130,7 @@ def plot(fig, pconfig):
   </div>
   {data_html}
   <script type="text/javascript">
-    var figure = JSON.parse($("#{data_id}").html());
-    figure.layout.autosize = true
-    Plotly.newPlot("{id}", figure.data, figure.layout);
-    // When plotly is working, hide something
-    $("#{id}").removeClass("not_rendered");
-    $("#{id} small").hide();
-    // update the layout to expand to the available size
-    // when the window is resized
-    window.onresize = function() {{
-      $(".js-plotly-plot").each(function () {{
-        const id = $(this).attr('id');
-        Plotly.relayout(id, {{
-          "xaxis.autorange": true,
-          "yaxis.autorange": true
-        }});
-      }})
-    }};
+    quartet_plotly_register("{id}", "{data_id}");
   </script>
   '''.format(id=pconfig['id'], data_id=pconfig['data_id'], data_html=data_html)
-    return html
\ No newline at end of file
+    return html
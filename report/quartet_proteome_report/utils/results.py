@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+""" Shared loader for the result files of the Quartet Proteomics pipeline
+
+MultiQC walks the analysis directories once and records the matched files
+in `report.files`. The loader reuses that index and parses each result
+file only once, so that every report module gets the same cached object
+instead of searching and re-reading the file on its own.
+
+Tables written as Feather (PROTQC_OUTPUT_FORMAT=feather) are read first,
+the TSV files are the fallback. pandas is only imported once a table is
+read, the plugin hooks import this module on every MultiQC run.
+"""
+
+from __future__ import print_function
+import json
+import logging
+import os
+
+from multiqc.utils import report, config
+
+# Initialise the main MultiQC logger
+log = logging.getLogger('multiqc')
+
+# Search pattern keys and file names of all result files
+SEARCH_PATTERNS = {
+  'general_information/information': '^general_information.json$',
+  'conclusion/conclusion_table': '^conclusion_table.(tsv|feather)$',
+  'conclusion/rank_table': '^rank_table.(tsv|feather)$',
+  'conclusion/cutoff_table': '^cutoff_table.(tsv|feather)$',
+  'snr/table': '^pca_table.(tsv|feather)$',
+  'correlation/table': '^corr_table.(tsv|feather)$'
+}
+
+# Text columns of each table, all the other columns are parsed as float
+TEXT_COLUMNS = {
+  'conclusion/conclusion_table': ['Quality Metrics', 'Historical Value (mean \\u00b1 SD)', 'Rank', 'Performance'],
+  'conclusion/rank_table': ['Batch'],
+  'conclusion/cutoff_table': ['Cut-off'],
+  'snr/table': ['sample_id', 'sample'],
+  'correlation/table': ['Name', 'Sequence', 'Sample.Pair']
+}
+
+
+def read_table(path, sp_key):
+  """ Parse a result table (TSV or Feather) into a typed DataFrame """
+  import numpy as np
+  import pandas as pd
+
+  text_columns = TEXT_COLUMNS.get(sp_key, [])
+  if path.endswith('.feather'):
+    df = pd.read_feather(path)
+    # Same dtypes as from the TSV files, whatever the writer kept
+    for c in df.columns:
+      if c in text_columns:
+        df[c] = pd.Series(df[c].astype(object).where(df[c].notna(), np.nan), dtype=str)
+      else:
+        df[c] = pd.to_numeric(df[c], errors='coerce').astype('float64')
+    return df
+
+  header = pd.read_csv(path, sep='\t', nrows=0).columns
+  dtype = {c: (str if c in text_columns else 'float64') for c in header}
+  return pd.read_csv(path, sep='\t', dtype=dtype)
+
+
+def read_json(path):
+  """ Parse a JSON result file into a dict """
+  with open(path, 'r', encoding='utf-8') as f:
+    return json.load(f)
+
+
+class ResultLoader(object):
+  """ Resolve the result files from the MultiQC file index and cache the parsed objects """
+
+  def __init__(self):
+    self._cache = {}
+
+  def find(self, sp_key):
+    """ Return the path of the file matched by the search pattern key, or None """
+    matched = report.files.get(sp_key, [])
+    if len(matched) == 0:
+      return None
+    # Prefer Feather, then keep the last match, as the modules did when iterating over find_log_files
+    feather = [f for f in matched if f['fn'].endswith('.feather')]
+    f = (feather or matched)[-1]
+    report.last_found_file = os.path.join(f['root'], f['fn'])
+    return report.last_found_file
+
+  def has(self, sp_key):
+    """ Whether a file matched the search pattern key, nothing is parsed """
+    return len(report.files.get(sp_key, [])) != 0
+
+  def load(self, sp_key):
+    """ Return the parsed result file, None if no file matched the search pattern key """
+    if sp_key not in self._cache:
+      path = self.find(sp_key)
+      if path is None:
+        self._cache[sp_key] = None
+      elif path.endswith('.json'):
+        self._cache[sp_key] = read_json(path)
+      else:
+        self._cache[sp_key] = read_table(path, sp_key)
+    return self._cache[sp_key]
+
+  def table(self, sp_key):
+    """ Return a copy of the parsed table, an empty DataFrame if it is missing """
+    data = self.load(sp_key)
+    if data is None:
+      import pandas as pd
+      return pd.DataFrame()
+    return data.copy()
+
+  def dict(self, sp_key):
+    """ Return a copy of the parsed JSON file, an empty dict if it is missing """
+    data = self.load(sp_key)
+    if data is None:
+      return {}
+    return dict(data)
+
+
+def get_results():
+  """ Return the loader set up by the execution_start hook """
+  if getattr(config, 'quartet_proteome_report_results', None) is None:
+    config.quartet_proteome_report_results = ResultLoader()
+  return config.quartet_proteome_report_results
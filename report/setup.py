@@ -24,9 +24,12 @@ setup(
     'multiqc==1.11',
     'plotly==4.9.0',
     'pandas==1.2.4',
-    'seaborn==0.11.2',
-    'Cython==0.29.28'
+    'scipy==1.6.3'
   ],
+  extras_require = {
+    # Read the result tables written with PROTQC_OUTPUT_FORMAT=feather
+    'feather': ['pyarrow']
+  },
   entry_points = {
     'multiqc.modules.v1': [
       'general_information = quartet_proteome_report.modules.general_information:MultiqcModule',
@@ -36,7 +39,8 @@ setup(
       'supplementary = quartet_proteome_report.modules.supplementary:MultiqcModule'
     ],
     'multiqc.hooks.v1': [
-      'execution_start = quartet_proteome_report.custom_code:quartet_proteome_report_execution_start'
+      'execution_start = quartet_proteome_report.custom_code:quartet_proteome_report_execution_start',
+      'execution_finish = quartet_proteome_report.custom_code:quartet_proteome_report_execution_finish'
     ],
     'multiqc.cli_options.v1': [
       'disable_plugin = quartet_proteome_report.cli:disable_plugin'
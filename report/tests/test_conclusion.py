@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+""" The compact mode of the Performance Score heatmap """
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from quartet_proteome_report.modules.conclusion.conclusion import compact_quality_score, heatmap_scores
+
+METRICS = ['Absolute Correlation', 'Coefficient of variantion (CV, %)', 'Missing percentage (%)',
+           'Number of features', 'Relative Correlation with Reference Datasets (RC)',
+           'Signal-to-Noise Ratio (SNR)', 'Total Score']
+SCORE_CONFIG = {'score_heatmap_max_batches': 100, 'score_heatmap_bins': 20}
+
+
+def score_table(n_batches, queried_score):
+  """ n_batches historical batches scoring 1..n_batches in every metric and the queried data,
+  sorted by total score as plot_quality_score gets them """
+  scores = np.append(np.arange(1, n_batches + 1, dtype=float), queried_score)
+  df = pd.DataFrame({m: scores for m in METRICS})
+  df.insert(0, 'Batch', ['Batch_{}'.format(i) for i in range(1, n_batches + 1)] + ['Queried_Data'])
+  return df.sort_values('Total Score', kind='stable').reset_index(drop=True)
+
+
+@pytest.mark.parametrize('n_batches', [5, 100])
+def test_few_batches_are_unchanged(n_batches):
+  df = score_table(n_batches, 2.5)
+  compact, heatmap_df = heatmap_scores(df, SCORE_CONFIG)
+  assert not compact
+  assert heatmap_df is df
+
+
+def test_many_batches_are_binned():
+  df = score_table(500, 0.5)
+  compact, heatmap_df = heatmap_scores(df, SCORE_CONFIG)
+  assert compact
+  assert len(heatmap_df) == 21
+  bins = heatmap_df[heatmap_df['Batch'] != 'Queried_Data']
+  assert list(bins['Batch'][:2]) == ['P0-5 (n=25)', 'P5-10 (n=25)']
+  assert bins['Batch'].iloc[-1] == 'P95-100 (n=25)'
+  # The median of batches 1..25, 26..50, ...
+  np.testing.assert_array_equal(bins['Total Score'], np.arange(20) * 25 + 13)
+  np.testing.assert_array_equal(bins['Number of features'], bins['Total Score'])
+
+
+def test_uneven_bins():
+  df = score_table(7, 0.5)
+  heatmap_df = compact_quality_score(df, 3)
+  assert list(heatmap_df['Batch']) == ['Queried_Data', 'P0-42 (n=3)', 'P42-71 (n=2)', 'P71-100 (n=2)']
+  np.testing.assert_array_equal(heatmap_df['Total Score'], [0.5, 2, 4.5, 6.5])
+
+
+def test_bins_are_limited_to_the_batches():
+  heatmap_df = compact_quality_score(score_table(3, 0.5), 20)
+  assert list(heatmap_df['Batch']) == ['Queried_Data', 'P0-33 (n=1)', 'P33-66 (n=1)', 'P66-100 (n=1)']
+
+
+@pytest.mark.parametrize('queried_score, position', [
+  (0.5, 0),      # below all batches
+  (130.5, 5),    # batch 131 scores higher, the queried data goes before its bin (126..150)
+  (125.5, 5),    # at the edge of a bin
+  (1000, 20)     # above all batches
+])
+def test_queried_data_at_its_rank(queried_score, position):
+  heatmap_df = compact_quality_score(score_table(500, queried_score), 20)
+  assert len(heatmap_df) == 21
+  assert heatmap_df['Batch'].iloc[position] == 'Queried_Data'
+  assert heatmap_df['Total Score'].iloc[position] == queried_score
+  # The queried row is kept as is
+  assert (heatmap_df.loc[position, METRICS] == queried_score).all()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+""" The thinning of the RC scatter in large-data mode """
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from quartet_proteome_report.modules.correlation.correlation import scatter_points, thin_points
+
+RC_CONFIG = {
+  'rc_scatter_webgl_threshold': 100,
+  'rc_scatter_bins': 10,
+  'rc_scatter_points_per_bin': 2,
+  'rc_scatter_outlier_mad': 3.5
+}
+
+
+def corr_table(test, reference, pair='D5/D6'):
+  return pd.DataFrame({
+    'logFC.Test': np.asarray(test, dtype=float),
+    'Sample.Pair': pair,
+    'logFC.Reference': np.asarray(reference, dtype=float),
+    'Sequence': ['P{}'.format(i) for i in range(len(test))]
+  })
+
+
+@pytest.fixture
+def dense_and_sparse():
+  rng = np.random.default_rng(1)
+  # 500 points in one cell around (0.5, 0.5), 9 points alone in their cells on the diagonal
+  dense = 0.5 + rng.uniform(0, 0.1, size=500)
+  sparse = np.array([-4.5, -3.5, -2.5, -1.5, -0.5, 1.5, 2.5, 3.5, 4.5])
+  return corr_table(np.concatenate([dense, sparse]), np.concatenate([dense, sparse]))
+
+
+def test_dense_cells_are_limited(dense_and_sparse):
+  thinned = thin_points(dense_and_sparse, 5, bins=10, points_per_bin=2, outlier_mad=3.5)
+  assert ((thinned['logFC.Test'] >= 0.5) & (thinned['logFC.Test'] < 0.6)).sum() == 2
+
+
+def test_sparse_cells_are_kept(dense_and_sparse):
+  thinned = thin_points(dense_and_sparse, 5, bins=10, points_per_bin=2, outlier_mad=3.5)
+  assert set([-4.5, -3.5, -2.5, -1.5, -0.5, 1.5, 2.5, 3.5, 4.5]) <= set(thinned['logFC.Test'])
+
+
+def test_sample_is_seeded_not_file_order(dense_and_sparse):
+  thinned = thin_points(dense_and_sparse, 5, bins=10, points_per_bin=2, outlier_mad=3.5)
+  again = thin_points(dense_and_sparse, 5, bins=10, points_per_bin=2, outlier_mad=3.5)
+  pd.testing.assert_frame_equal(thinned, again)
+  dense_rows = thinned.index[thinned.index < 500]
+  assert list(dense_rows) != [0, 1]
+
+
+def test_outliers_are_kept():
+  rng = np.random.default_rng(2)
+  reference = rng.uniform(-1, 1, size=1000)
+  test = reference + rng.normal(0, 0.05, size=1000)
+  test[10] = reference[10] + 3
+  thinned = thin_points(corr_table(test, reference), 5, bins=10, points_per_bin=2, outlier_mad=3.5)
+  assert 10 in thinned.index
+  assert len(thinned) < 100
+
+
+def test_sample_pairs_are_thinned_separately():
+  data = pd.concat([corr_table([0.5] * 50, [0.5] * 50, pair) for pair in ['D5/D6', 'F7/D6', 'M8/D6']],
+                   ignore_index=True)
+  thinned = thin_points(data, 5, bins=10, points_per_bin=2, outlier_mad=3.5)
+  assert thinned['Sample.Pair'].value_counts().to_dict() == {'D5/D6': 2, 'F7/D6': 2, 'M8/D6': 2}
+
+
+def test_unchanged_below_the_threshold():
+  data = corr_table([0.5] * 100, [0.5] * 100)
+  assert scatter_points(data, 5, RC_CONFIG) is data
+
+
+def test_thinned_above_the_threshold():
+  data = corr_table([0.5] * 101, [0.5] * 101)
+  assert len(scatter_points(data, 5, RC_CONFIG)) == 2
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+""" group_cv against hand-computed CVs, the cases of protqc/tests/testthat/test-qc_group_cv.R
+
+Samples come in order of appearance and features in row order, NaN for
+single values and no entry when a feature has no value in a sample.
+"""
+
+import numpy as np
+
+from quartet_proteome_report.metrics.qc_metrics import group_cv
+
+NA = np.nan
+GROUP = ['D5', 'D5', 'D6', 'D6']
+
+
+def test_positive_values():
+  values = np.array([[1, 3, 2, 2],
+                     [2, NA, 4, 8],
+                     [NA, NA, 5, 15]])
+  cv = group_cv(values, ['A', 'B', 'C'], GROUP)
+  np.testing.assert_allclose(cv, [np.sqrt(2) / 2, NA, 0, np.sqrt(8) / 6, np.sqrt(50) / 10])
+
+
+def test_log2_values_with_negatives():
+  values = np.array([[-1, 1, 0, 0],
+                     [1, NA, 2, 3],
+                     [NA, NA, 0, 1]])
+  cv = group_cv(values, ['A', 'B', 'C'], GROUP)
+  np.testing.assert_allclose(cv, [np.sqrt(1.125) / 1.25, NA, 0, np.sqrt(8) / 6, np.sqrt(0.5) / 1.5])
+
+
+def test_duplicated_features_are_pooled():
+  values = np.array([[1, 3, 2, 2],
+                     [2, NA, 4, 8],
+                     [5, NA, NA, 6]])
+  cv = group_cv(values, ['A', 'B', 'A'], GROUP)
+  np.testing.assert_allclose(cv, [2 / 3, NA, np.sqrt(48) / 10, np.sqrt(8) / 6])
+
+
+def test_single_value_groups():
+  values = np.array([[1, 2, 2, 7],
+                     [2, 4, 8, 7]], dtype=float)
+  cv = group_cv(values, ['A', 'B'], ['D5', 'D6', 'D6', None])
+  np.testing.assert_allclose(cv, [NA, NA, 0, np.sqrt(8) / 6])
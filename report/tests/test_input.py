@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+""" The header checks of input_data, with the messages of protqc::input_data """
+
+import pytest
+
+from quartet_proteome_report.metrics import input_data
+from quartet_proteome_report.metrics.table import read_header
+
+
+@pytest.fixture
+def meta_file(tmp_path):
+  path = tmp_path / 'metadata.csv'
+  path.write_text('library,sample\nD5_1,D5\nD6_1,D6\n')
+  return str(path)
+
+
+def test_read_header_keeps_the_names(tmp_path):
+  path = tmp_path / 'data.tsv'
+  path.write_text('"Type"\t"Feature"\t"a,b"\tX\tX\r\nProtein\tP1\t1\t2\t3\r\n')
+  assert read_header(str(path)) == ('\t', ['Type', 'Feature', 'a,b', 'X', 'X'])
+
+
+def test_duplicated_columns(tmp_path, meta_file):
+  path = tmp_path / 'data.csv'
+  path.write_text('Type,Feature,D5_1,D5_1,D6_1\nProtein,P1,1,2,3\n')
+  with pytest.raises(ValueError, match='Duplicated column names in data.'):
+    input_data(str(path), meta_file)
+
+
+def test_columns_not_in_metadata(tmp_path, meta_file):
+  path = tmp_path / 'data.csv'
+  path.write_text('Type,Feature,D5_1,F7_1\nProtein,P1,1,2\n')
+  with pytest.raises(ValueError, match='The column names does not correspond to input metadata.'):
+    input_data(str(path), meta_file)
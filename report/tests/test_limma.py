@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+""" The limma port against values computed independently
+
+The expected values were computed with mpmath at 60 digits, from the
+definitions of limma:::tmixture.vector and the t distribution.
+"""
+
+import numpy as np
+
+from quartet_proteome_report.metrics.limma import p_adjust_bh, tmixture_vector
+
+
+def test_tmixture_vector_with_different_df():
+  # 2 target features, the first has 3 df: its t is moved to the 10 df of the others
+  # through the upper tail, pt(1e6, 3) rounds to 1 in the lower tail
+  tstat = np.concatenate([np.linspace(-1, 1, 198), [1e6, 50.0]])
+  stdev_unscaled = np.full(200, 0.5)
+  df = np.concatenate([np.full(198, 10.0), [3.0, 10.0]])
+  var_prior = tmixture_vector(tstat, stdev_unscaled, df, 0.02, (1e-4, 1e4))
+  np.testing.assert_allclose(var_prior, (2288.565247 + 724.6608808) / 2, rtol=1e-9)
+
+
+def test_tmixture_vector_with_equal_df():
+  tstat = np.concatenate([np.linspace(-1, 1, 198), [1e6, 50.0]])
+  df = np.full(200, 10.0)
+  var_prior = tmixture_vector(tstat, np.full(200, 0.5), df, 0.02, (1e-4, 1e4))
+  # The first target is far beyond the null, its v0 is clipped
+  np.testing.assert_allclose(var_prior, (1e4 + 724.6608808) / 2, rtol=1e-9)
+
+
+def test_p_adjust_bh():
+  p = np.array([0.01, 0.04, 0.03, 0.005, 0.5])
+  np.testing.assert_allclose(p_adjust_bh(p), [0.025, 0.05, 0.05, 0.025, 0.5])
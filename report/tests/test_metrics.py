@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+""" The metric engine against the protqc result tables
+
+data/input is a synthetic dataset (benchmarks/synthetic.py: 300 proteins,
+800 peptides, seed 7, values rounded to 2 decimals). data/expected holds
+the result tables of protqc::qc_conclusion for it (make test-data, R and
+protqc required): the conclusion, rank and cutoff tables are compared byte
+for byte, the DEP and fold change tables of the limma/edgeR port and the
+PCA scores within a tolerance (the sign of a PC is arbitrary, the last
+digits depend on the LAPACK build). The tests are skipped until the tables
+are generated.
+
+data/snapshot holds the result tables of this engine for the same input,
+they catch any change of its output.
+
+protqc/test/output was computed by protqc from an input that isn't shipped
+(only its metadata template is): its conclusion, rank and cutoff tables are
+recomputed from its metric values, SNR and RC from its PCA and fold change tables.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from quartet_proteome_report.metrics import qc_conclusion
+from quartet_proteome_report.metrics.datasets import load_dataset
+from quartet_proteome_report.metrics.output import conclusion_tables
+from quartet_proteome_report.metrics.qc_metrics import r_round, signal_to_noise
+from quartet_proteome_report.metrics.qc_pipelines import METRICS, baseline_index, baseline_index_from_table
+from quartet_proteome_report.metrics.table import write_table
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(TESTS_DIR, 'data')
+EXPECTED_DIR = os.path.join(DATA_DIR, 'expected')
+PROTQC_OUTPUT = os.path.join(TESTS_DIR, '..', '..', 'protqc', 'test', 'output')
+
+TABLES = ['conclusion_table', 'rank_table', 'cutoff_table', 'deps_table', 'corr_table']
+
+
+def read_bytes(path):
+  with open(path, 'rb') as f:
+    return f.read()
+
+
+def assert_pca_equal(path, expected_path):
+  pca = pd.read_csv(path, sep='\t')
+  expected = pd.read_csv(expected_path, sep='\t')
+  assert list(pca.columns) == list(expected.columns)
+  pd.testing.assert_frame_equal(pca[['sample_id', 'sample']], expected[['sample_id', 'sample']])
+  # The last PC of 12 samples is numerical noise
+  for pc in expected.columns[2:-1]:
+    sign = np.sign(np.dot(pca[pc], expected[pc]))
+    np.testing.assert_allclose(sign * pca[pc], expected[pc], rtol=1e-6, atol=1e-8)
+
+
+@pytest.fixture(scope='module')
+def result_dir(tmp_path_factory):
+  output_dir = str(tmp_path_factory.mktemp('results'))
+  qc_conclusion(os.path.join(DATA_DIR, 'input', 'data.csv'),
+                os.path.join(DATA_DIR, 'input', 'metadata.csv'), output_dir)
+  return output_dir
+
+
+@pytest.mark.parametrize('name', TABLES)
+def test_qc_conclusion_snapshot(result_dir, name):
+  assert read_bytes(os.path.join(result_dir, name + '.tsv')) == \
+    read_bytes(os.path.join(DATA_DIR, 'snapshot', name + '.tsv'))
+
+
+def test_qc_conclusion_pca_snapshot(result_dir):
+  assert_pca_equal(os.path.join(result_dir, 'pca_table.tsv'), os.path.join(DATA_DIR, 'snapshot', 'pca_table.tsv'))
+
+
+requires_expected = pytest.mark.skipif(not os.path.isdir(EXPECTED_DIR),
+                                       reason='data/expected is not generated, run make test-data')
+
+
+@requires_expected
+@pytest.mark.parametrize('name', ['conclusion_table', 'rank_table', 'cutoff_table'])
+def test_qc_conclusion_tables_of_protqc(result_dir, name):
+  assert read_bytes(os.path.join(result_dir, name + '.tsv')) == \
+    read_bytes(os.path.join(EXPECTED_DIR, name + '.tsv'))
+
+
+@requires_expected
+@pytest.mark.parametrize('name, values', [
+  ('deps_table', ['logFC', 'AveExpr', 't', 'P.Value', 'adj.P.Val', 'B']),
+  ('corr_table', ['logFC.Test', 'logFC.Reference'])
+])
+def test_de_tables_of_protqc(result_dir, name, values):
+  table = pd.read_csv(os.path.join(result_dir, name + '.tsv'), sep='\t')
+  expected = pd.read_csv(os.path.join(EXPECTED_DIR, name + '.tsv'), sep='\t')
+  assert list(table.columns) == list(expected.columns)
+  # The same DEPs, in the same order
+  pd.testing.assert_frame_equal(table.drop(columns=values), expected.drop(columns=values))
+  for column in values:
+    np.testing.assert_allclose(table[column], expected[column], rtol=1e-6, atol=1e-10, err_msg=column)
+
+
+@requires_expected
+def test_qc_conclusion_pca_of_protqc(result_dir):
+  assert_pca_equal(os.path.join(result_dir, 'pca_table.tsv'), os.path.join(EXPECTED_DIR, 'pca_table.tsv'))
+
+
+requires_protqc_output = pytest.mark.skipif(not os.path.isdir(PROTQC_OUTPUT), reason='protqc/test/output is not available')
+
+
+@requires_protqc_output
+@pytest.mark.parametrize('name', ['conclusion_table', 'rank_table', 'cutoff_table'])
+def test_conclusion_tables_of_protqc(tmp_path, name):
+  expected = pd.read_csv(os.path.join(PROTQC_OUTPUT, 'conclusion_table.tsv'), sep='\t')
+  values = dict(zip(expected['Quality Metrics'], expected['Value']))
+  allmetrics_dt = pd.DataFrame({'Quality Metrics': METRICS, 'Value': [float(values[m]) for m in METRICS]})
+
+  table = conclusion_tables(allmetrics_dt)[name]
+  write_table(table, str(tmp_path / (name + '.tsv')))
+  assert read_bytes(str(tmp_path / (name + '.tsv'))) == read_bytes(os.path.join(PROTQC_OUTPUT, name + '.tsv'))
+
+
+@requires_protqc_output
+def test_snr_of_protqc():
+  pca = pd.read_csv(os.path.join(PROTQC_OUTPUT, 'pca_table.tsv'), sep='\t')
+  scores = pca.iloc[:, 2:].to_numpy()
+  # prcomp scores are centered: the variance of a PC is its sum of squares
+  variance = (scores ** 2).sum(axis=0)
+  percent = np.array([r_round(v, 5) for v in variance / variance.sum()])
+  assert signal_to_noise(scores, percent, pca['sample']) == 27.179
+
+
+@requires_protqc_output
+def test_rc_of_protqc():
+  corr = pd.read_csv(os.path.join(PROTQC_OUTPUT, 'corr_table.tsv'), sep='\t')
+  assert r_round(np.corrcoef(corr['logFC.Test'], corr['logFC.Reference'])[0, 1], 3) == 0.827
+
+
+def test_shipped_baseline_index():
+  # historical_qc_index holds the cut-offs of quantile(type = 7) in R,
+  # np.quantile may differ from them in the last bit
+  shipped = baseline_index_from_table(load_dataset('historical_qc_index'))
+  index = baseline_index(load_dataset('historical_qc'), load_dataset('historical_qc_norm'))
+  assert sorted(shipped) == sorted(index)
+  for metric, ref in index.items():
+    assert shipped[metric]['length'] == ref['length']
+    np.testing.assert_array_equal(shipped[metric]['sorted'], ref['sorted'])
+    np.testing.assert_array_equal([shipped[metric]['min'], shipped[metric]['max']], [ref['min'], ref['max']])
+    np.testing.assert_allclose(shipped[metric]['cutoffs'], ref['cutoffs'], rtol=1e-12)
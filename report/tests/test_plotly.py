@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+""" The typed arrays and the shared templates of the embedded plotly figures """
+
+import base64
+
+import numpy as np
+import plotly.graph_objects as go
+import pytest
+
+from quartet_proteome_report.utils.plotly import encode_array, encode_arrays, fig_to_json_html, \
+  reset_templates, template_to_html
+
+
+def decode(encoded):
+  dtype = {'f4': '<f4', 'i4': '<i4'}[encoded['dtype']]
+  return np.frombuffer(base64.b64decode(encoded['bdata']), dtype=dtype)
+
+
+@pytest.fixture(autouse=True)
+def new_report():
+  reset_templates()
+
+
+def test_float_array_round_trip():
+  values = np.array([0.5, -1.25, np.nan, 3.0, 1e6, -2.5, np.inf, 0.0])
+  encoded = encode_array(values)
+  assert encoded['dtype'] == 'f4'
+  np.testing.assert_array_equal(decode(encoded), values.astype('<f4'))
+
+
+def test_float_list_with_none_round_trip():
+  values = [0.5, None, 2.25, float('nan'), 4.0, 5.5, None, 7.0]
+  encoded = encode_array(values)
+  assert encoded['dtype'] == 'f4'
+  np.testing.assert_array_equal(decode(encoded), [0.5, np.nan, 2.25, np.nan, 4.0, 5.5, np.nan, 7.0])
+
+
+def test_int_array_round_trip():
+  values = np.arange(-4, 6, dtype=np.int64)
+  encoded = encode_array(values)
+  assert encoded['dtype'] == 'i4'
+  np.testing.assert_array_equal(decode(encoded), values)
+  assert encode_array(list(values.tolist()))['dtype'] == 'i4'
+
+
+def test_int_array_beyond_int32_not_encoded():
+  values = np.array([2 ** 31] + list(range(7)), dtype=np.int64)
+  assert encode_array(values) is values
+
+
+@pytest.mark.parametrize('values', [
+  ['D5', 'D6', 'F7', 'M8', 'D5', 'D6', 'F7', 'M8'],
+  np.array(['D5', 'D6', 'F7', 'M8', 'D5', 'D6', 'F7', 'M8']),
+  [True, False, True, False, True, False, True, False],
+  [1, 2, 3, 'a', 5, 6, 7, 8],
+  [None] * 8,
+  [1.0, 2.0, 3.0],
+  np.arange(12).reshape(3, 4),
+  'logFC',
+  1.5
+], ids=['str-list', 'str-array', 'bool-list', 'mixed-list', 'none-list', 'short-list', '2d-array', 'str', 'float'])
+def test_not_encoded(values):
+  assert encode_array(values) is values
+
+
+def test_encode_arrays_keeps_the_structure():
+  figure = {'data': [{'x': list(range(10)), 'name': 'D5/D6', 'text': ['a'] * 10}]}
+  encoded = encode_arrays(figure)
+  assert encoded['data'][0]['x']['dtype'] == 'i4'
+  assert encoded['data'][0]['name'] == 'D5/D6'
+  assert encoded['data'][0]['text'] == ['a'] * 10
+
+
+def test_template_written_once_per_report():
+  template = {'layout': {'font': {'size': 12}}}
+  template_id, html = template_to_html(template)
+  assert template_id in html
+  assert template_to_html(template) == (template_id, '')
+  assert template_to_html({'layout': {'font': {'size': 14}}})[1] != ''
+
+  reset_templates()
+  assert template_to_html(template) == (template_id, html)
+
+
+def test_figures_share_the_template():
+  def figure_html(data_id):
+    fig = go.Figure(go.Scatter(x=list(range(10)), y=list(range(10))), layout={'template': 'plotly_white'})
+    return fig_to_json_html(fig, {'data_id': data_id})
+
+  first, second = figure_html('first'), figure_html('second')
+  assert first.count('<script id="plotly_template_') == 1
+  assert second.count('<script id="plotly_template_') == 0
+
+  reset_templates()
+  assert figure_html('third').count('<script id="plotly_template_') == 1
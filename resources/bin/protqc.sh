@@ -20,14 +20,41 @@ set -o pipefail
 
 show_help() {
 	cat <<EOF
-usage: $(echo $0) [-d <DATA_FILE>] [-m <META_FILE>] [-o <RESULT_DIR>]
+usage: $(echo $0) [-d <DATA_FILE>] [-m <META_FILE>] [-o <RESULT_DIR>] [-e <ENGINE>] [-w <WORKERS>]
+       $(echo $0) [-b <MANIFEST>] [-j <JOBS>] [-e <ENGINE>] [-w <WORKERS>]
+       $(echo $0) -s [-w <WORKERS>]
+       $(echo $0) -V
        -d DATA_FILE Proteomics profiled data.
        -m META_FILE Metadata file.
        -o RESULT_DIR A directory for result files.
+       -b MANIFEST Batch mode: a TSV file with the columns data_file, metadata_file and result_dir.
+                   The status of each entry is written to MANIFEST.status.
+       -j JOBS The number of entries of a manifest processed in parallel (1 by default).
+       -s Worker mode: keep protqc & its datasets loaded and read jobs from stdin,
+          one per line ("RUN<TAB>DATA_FILE<TAB>META_FILE<TAB>RESULT_DIR", "PING" or "QUIT").
+          Replies are written to stdout ("READY", "OK", "ERROR<TAB>MSG" or "PONG"),
+          the output of protqc goes to stderr.
+       -V Print the version of protqc and the md5sum of its datasets (the historical baseline).
+       -e ENGINE r (protqc, default) or python (quartet_proteome_report.metrics).
+       -w WORKERS The number of sample pairs analysed in parallel for RC (1 by default).
+
+       PROTQC_OUTPUT_FORMAT=feather writes the result tables as Feather files (arrow/pyarrow required).
+       PROTQC_RANDOMIZED_PCA=1 computes SNR from a randomized PCA of the first PCs only, faster on
+       wide protein tables: pca_table only has PC1 & PC2, SNR may differ in the last digit.
 EOF
 }
 
-while getopts ":hd:m:o:" arg; do
+DATA_FILE=""
+META_FILE=""
+RESULT_DIR=""
+MANIFEST=""
+JOBS=1
+SERVE=0
+SHOW_VERSION=0
+ENGINE="r"
+WORKERS=1
+
+while getopts ":hsVd:m:o:b:j:e:w:" arg; do
 	case "$arg" in
 	"d")
 		DATA_FILE="$OPTARG"
@@ -38,6 +65,24 @@ while getopts ":hd:m:o:" arg; do
 	"o")
 		RESULT_DIR="$OPTARG"
 		;;
+	"b")
+		MANIFEST="$OPTARG"
+		;;
+	"j")
+		JOBS="$OPTARG"
+		;;
+	"s")
+		SERVE=1
+		;;
+	"V")
+		SHOW_VERSION=1
+		;;
+	"e")
+		ENGINE="$OPTARG"
+		;;
+	"w")
+		WORKERS="$OPTARG"
+		;;
 	"?")
 		echo "Unkown option: $OPTARG"
 		exit 1
@@ -65,6 +110,138 @@ if [ "$?" -ne 0 ]; then
 	}
 fi
 
+if [ "$ENGINE" != "r" ] && [ "$ENGINE" != "python" ]; then
+	echo "$ENGINE is not a valid engine, r or python."
+	exit 1
+fi
+
+if [ "$SHOW_VERSION" -eq 1 ]; then
+	Rscript -e 'cat(as.character(packageVersion("protqc")), tools::md5sum(system.file("data", "Rdata.rdb", package = "protqc")), sep = "\t")'
+	exit $?
+fi
+
+if [ "$SERVE" -eq 1 ]; then
+	if [ "$ENGINE" != "r" ]; then
+		echo "Worker mode is only supported by the r engine."
+		exit 1
+	fi
+
+	TEMP=$(mktemp)
+
+	cat <<EOF >"$TEMP"
+#!/usr/bin/env Rscript
+
+serve <- function() {
+	# The script is parsed by now
+	unlink("$TEMP")
+	# Replies go to the real stdout, everything printed by protqc to stderr
+	output <- file("stdout", "w")
+	input <- file("stdin", "r")
+	sink(stderr())
+	reply <- function(...) {
+		cat(..., "\\n", sep = "", file = output)
+		flush(output)
+	}
+
+	library(protqc)
+	options(protqc.workers = $WORKERS)
+	invisible(protqc:::reference_index())
+	for (name in c("historical_qc", "historical_qc_norm", "historical_qc_stat")) {
+		invisible(protqc:::historical_dataset(name))
+	}
+	invisible(protqc:::baseline_index())
+	reply("READY")
+
+	repeat {
+		line <- readLines(input, n = 1)
+		if (length(line) == 0 || line == "QUIT") break
+		fields <- strsplit(line, "\t", fixed = TRUE)[[1]]
+		if (fields[1] == "PING") {
+			reply("PONG")
+		} else if (fields[1] == "RUN" && length(fields) == 4) {
+			msg <- tryCatch({
+				protqc::qc_conclusion(fields[2], fields[3], fields[4], plot=FALSE)
+				""
+			}, error = function(e) gsub("[[:space:]]+", " ", conditionMessage(e)))
+			if (msg == "") reply("OK") else reply("ERROR\t", msg)
+		} else {
+			reply("ERROR\tUnknown request: ", fields[1])
+		}
+	}
+}
+
+serve()
+EOF
+
+	exec Rscript $TEMP
+fi
+
+if [ -n "$MANIFEST" ]; then
+	if [ ! -f "$MANIFEST" ]; then
+		echo "$MANIFEST is not a valid file."
+		exit 1
+	fi
+	MANIFEST=$(realpath "$MANIFEST")
+
+	# Batch mode: one process for all entries, protqc & the datasets are loaded once
+	if [ "$ENGINE" == "python" ]; then
+		python -m quartet_proteome_report.metrics -b "$MANIFEST" -j "$JOBS" -w "$WORKERS"
+		exit $?
+	fi
+
+	TEMP=$(mktemp)
+
+	echo "Run script: $TEMP"
+
+	cat <<EOF >"$TEMP"
+#!/usr/bin/env Rscript
+
+run <- function(manifest) {
+	library(protqc)
+	options(protqc.workers = $WORKERS)
+	print("Running...")
+	# Loaded before the jobs are forked, shared by all of them
+	invisible(protqc:::reference_index())
+	entries <- read.delim(manifest, stringsAsFactors = FALSE)
+	status_row <- function(i, msg) {
+		data.frame(result_dir = entries\$result_dir[i],
+		           status = ifelse(msg == "", "Success", "Error"),
+		           msg = msg)
+	}
+	run_entry <- function(i) {
+		msg <- tryCatch({
+			protqc::qc_conclusion(entries\$data_file[i], entries\$metadata_file[i],
+			                      entries\$result_dir[i], plot=FALSE)
+			""
+		}, error = function(e) gsub("[[:space:]]+", " ", conditionMessage(e)))
+		status_row(i, msg)
+	}
+	status <- parallel::mclapply(seq_len(nrow(entries)), run_entry,
+	                             mc.cores = $JOBS, mc.preschedule = FALSE)
+	# A job which crashed or was killed returns a try-error (or NULL), not its row
+	status <- lapply(seq_along(status), function(i) {
+		if (is.data.frame(status[[i]])) return(status[[i]])
+		msg <- if (inherits(status[[i]], "try-error")) as.character(status[[i]]) else ""
+		status_row(i, trimws(gsub("[[:space:]]+", " ", paste("The job exited unexpectedly.", msg))))
+	})
+	# An empty manifest gives an empty status file
+	empty <- data.frame(result_dir = character(0), status = character(0), msg = character(0))
+	status <- do.call(rbind, c(list(empty), status))
+	write.table(status, paste0(manifest, ".status"), sep = "\t", row.names = F, quote = F)
+}
+
+run(commandArgs(trailingOnly = TRUE)[1])
+EOF
+
+	printf "\n---------------------\n"
+	cat "$TEMP"
+	echo "---------------------"
+
+	# The manifest is an argument of the script, not a part of its code
+	Rscript "$TEMP" "$MANIFEST"
+	exit $?
+fi
+
 if [ -z "$DATA_FILE" ]; then
 	echo "-d argument is not specified."
 	exit 1
@@ -95,6 +272,11 @@ else
 	RESULT_DIR=$(realpath $RESULT_DIR)
 fi
 
+if [ "$ENGINE" == "python" ]; then
+	python -m quartet_proteome_report.metrics -d "$DATA_FILE" -m "$META_FILE" -o "$RESULT_DIR" -w "$WORKERS"
+	exit $?
+fi
+
 TEMP=$(mktemp)
 
 echo "Run script: $TEMP"
@@ -106,6 +288,7 @@ run <- function() {
 	# Print traceback message
 	on.exit(traceback())
 	library(protqc)
+	options(protqc.workers = $WORKERS)
 	print("Running...")
 	result <- protqc::qc_conclusion("$DATA_FILE", "$META_FILE", "$RESULT_DIR", plot=FALSE)
 }
@@ -0,0 +1,87 @@
+(ns quartet-protqc-report.batch
+  "Generate many reports in one run from a manifest file."
+  (:require [clojure.data.csv :as csv]
+            [clojure.data.json :as json]
+            [clojure.java.io :as io]
+            [clojure.string :as clj-str]
+            [clojure.tools.logging :as log]
+            [local-fs.core :as fs-lib]
+            [quartet-protqc-report.protqc :as protqc]
+            [quartet-protqc-report.task :as task]))
+
+(defn- read-tsv
+  [manifest]
+  (with-open [reader (io/reader manifest)]
+    (let [[header & rows] (doall (csv/read-csv reader :separator \tab))]
+      (map #(zipmap (map keyword header) %) rows))))
+
+(defn read-manifest
+  "Read a manifest file (TSV with a header, or JSON array of objects).
+   Each entry has the keys data, metadata, output and optionally name & description."
+  [manifest]
+  (let [entries (if (clj-str/ends-with? (clj-str/lower-case manifest) ".json")
+                  (json/read-str (slurp manifest) :key-fn keyword)
+                  (read-tsv manifest))]
+    (map-indexed (fn [idx entry]
+                   (merge {:name (format "report-%d" (inc idx))
+                           :description "Quality control report"}
+                          (into {} (remove (comp clj-str/blank? str val) entry))))
+                 entries)))
+
+(defn- check-entry
+  "Return nil if the entry is valid, otherwise an error message."
+  [{:keys [data metadata output]}]
+  (cond
+    (not (fs-lib/file? (str data))) (format "%s is not a valid file." data)
+    (not (fs-lib/file? (str metadata))) (format "%s is not a valid file." metadata)
+    (nil? output) "The output directory is not specified."
+    :else nil))
+
+(defn- render-entry!
+  "Write the general information and render the report of one entry."
+  [{:keys [output] :as entry} protqc-result plugin-metadata]
+  (let [result-dir (fs-lib/join-paths output "results")
+        results (if (= (:status protqc-result) "Success")
+                  (let [info (task/write-information! result-dir
+                                                      (merge plugin-metadata
+                                                             (select-keys entry [:name :description])))]
+                    [protqc-result info (task/render-report! result-dir output)])
+                  [protqc-result])]
+    (assoc (task/finish-report! output results nil) :output output)))
+
+(defn run-batch!
+  "Generate the reports of all entries in a manifest.
+   protqc runs once for all valid entries, then the reports are rendered by `jobs` threads.
+   workers: The number of sample pairs of an entry analysed in parallel for RC.
+   Returns the result ({:output :status :msg}) of each entry."
+  [manifest jobs workers plugin-metadata]
+  (let [entries (read-manifest manifest)
+        errors (map check-entry entries)
+        valid (keep (fn [[entry error]] (when-not error entry)) (map vector entries errors))
+        _ (doseq [{:keys [output]} valid]
+            (fs-lib/create-directories! (fs-lib/join-paths output "results")))
+        protqc-results (protqc/call-protqc-batch!
+                        (map (fn [{:keys [data metadata output]}]
+                               {:data-file data
+                                :metadata-file metadata
+                                :result-dir (fs-lib/join-paths output "results")})
+                             valid)
+                        jobs
+                        workers)
+        pool (java.util.concurrent.Executors/newFixedThreadPool jobs)]
+    (log/info (format "Rendering %d reports with %d jobs." (count valid) jobs))
+    (try
+      (let [tasks (map (fn [{:keys [output] :as entry}]
+                         (fn []
+                           (render-entry! entry
+                                          (get protqc-results (fs-lib/join-paths output "results"))
+                                          plugin-metadata)))
+                       valid)
+            rendered (->> (.invokeAll pool ^java.util.Collection (vec tasks))
+                          (mapv #(.get ^java.util.concurrent.Future %)))]
+        (concat rendered
+                (keep (fn [[entry error]]
+                        (when error {:output (:output entry) :status "Error" :msg error}))
+                      (map vector entries errors))))
+      (finally
+        (.shutdown pool)))))
@@ -0,0 +1,167 @@
+(ns quartet-protqc-report.cache
+  "A local cache of the protqc results, keyed on the sha256 of the data file, the metadata file,
+   the protqc version, its historical baseline and the settings changing the results
+   (PROTQC_OUTPUT_FORMAT & PROTQC_RANDOMIZED_PCA, see protqc/protqc-env).
+
+   PROTQC_CACHE_DIR: The cache directory (quartet-protqc-report-cache in java.io.tmpdir by default).
+   PROTQC_CACHE_SIZE: The maximum size of the cache in MB, the least recently used results are
+                      evicted first, 0 disables the cache (1024 by default).
+
+   Entries are only evicted while no task of this process restores one."
+  (:require [clojure.java.io :as io]
+            [clojure.java.shell :as shell :refer [sh]]
+            [clojure.string :as clj-str]
+            [clojure.tools.logging :as log]
+            [local-fs.core :as fs-lib]
+            [quartet-protqc-report.protqc :as protqc])
+  (:import [java.nio.file Files StandardCopyOption]
+           [java.security DigestInputStream MessageDigest]
+           [java.util.concurrent.locks ReentrantReadWriteLock]))
+
+(def cache-dir
+  (or (System/getenv "PROTQC_CACHE_DIR")
+      (fs-lib/join-paths (System/getProperty "java.io.tmpdir") "quartet-protqc-report-cache")))
+
+(def max-size
+  (* (Long/parseLong (or (System/getenv "PROTQC_CACHE_SIZE") "1024")) 1024 1024))
+
+;; Restores share the read lock, an eviction takes the write lock
+(defonce ^:private entries-lock (ReentrantReadWriteLock.))
+
+;; The version of protqc, only kept once it is known: a failure is retried by the next submission
+(defonce ^:private known-version (atom nil))
+
+;; Timings of the run which wrote the results, not part of the results
+(def ^:private uncached-files #{"stage_timings.tsv"})
+
+(defn- protqc-version
+  []
+  (or @known-version
+      (let [result (shell/with-sh-env (protqc/protqc-env)
+                     (sh "bash" "-c" "protqc.sh -V"))]
+        (if (= (:exit result) 0)
+          (reset! known-version (clj-str/trim (:out result)))
+          (log/warn "Cannot get the version of protqc, the result cache is skipped: " (:err result))))))
+
+(defn- file-sha256
+  [path]
+  (let [digest (MessageDigest/getInstance "SHA-256")]
+    (with-open [stream (DigestInputStream. (io/input-stream path) digest)]
+      (let [buffer (byte-array 65536)]
+        (while (pos? (.read stream buffer)))))
+    (format "%064x" (BigInteger. 1 (.digest digest)))))
+
+(defn- sha256
+  [^String text]
+  (let [digest (MessageDigest/getInstance "SHA-256")]
+    (format "%064x" (BigInteger. 1 (.digest digest (.getBytes text "UTF-8"))))))
+
+(defn cache-key
+  "The cache key of a submission, nil if the cache is disabled."
+  [data-file metadata-file]
+  (when-let [version (and (pos? max-size) (protqc-version))]
+    (sha256 (clj-str/join "\n" [(file-sha256 data-file)
+                                (file-sha256 metadata-file)
+                                version
+                                (or (System/getenv "PROTQC_OUTPUT_FORMAT") "tsv")
+                                (or (System/getenv "PROTQC_RANDOMIZED_PCA") "0")]))))
+
+(defn- files
+  [dir]
+  (filter #(.isFile ^java.io.File %) (file-seq (io/file dir))))
+
+(defn- copy-dir!
+  "Copy the files of from into to, except the relative paths in exclude."
+  ([from to]
+   (copy-dir! from to #{}))
+  ([from to exclude]
+   (let [from-path (.toPath (io/file from))]
+     (doseq [^java.io.File file (files from)
+             :let [path (str (.relativize from-path (.toPath file)))]
+             :when (not (contains? exclude path))]
+       (let [target (io/file to path)]
+         (io/make-parents target)
+         (Files/copy (.toPath file) (.toPath target)
+                     ^"[Ljava.nio.file.CopyOption;"
+                     (into-array StandardCopyOption [StandardCopyOption/REPLACE_EXISTING])))))))
+
+(defn- dir-size
+  [dir]
+  (reduce + (map #(.length ^java.io.File %) (files dir))))
+
+(defn- delete-dir!
+  [dir]
+  (doseq [^java.io.File file (reverse (file-seq (io/file dir)))]
+    (.delete file)))
+
+(defn- evict!
+  "Remove the least recently used entries until the cache fits in max-size."
+  []
+  (let [lock (.writeLock ^ReentrantReadWriteLock entries-lock)]
+    (.lock lock)
+    (try
+      (let [entries (->> (.listFiles (io/file cache-dir))
+                         (filter #(.isDirectory ^java.io.File %))
+                         (remove #(clj-str/starts-with? (.getName ^java.io.File %) "."))
+                         (sort-by #(.lastModified ^java.io.File %))
+                         (map (fn [entry] [entry (dir-size entry)])))]
+        (loop [entries entries
+               total (reduce + (map second entries))]
+          (when (and (seq entries) (> total max-size))
+            (let [[entry size] (first entries)]
+              (log/info "Evict the cached results " (.getName ^java.io.File entry))
+              (delete-dir! entry)
+              (recur (rest entries) (- total size))))))
+      (finally
+        (.unlock lock)))))
+
+(defn restore!
+  "Copy the cached results of key into result-dir, returns true on a hit.
+   The entry can't be evicted meanwhile."
+  [key result-dir]
+  (when key
+    (let [lock (.readLock ^ReentrantReadWriteLock entries-lock)
+          entry (io/file cache-dir key)]
+      (.lock lock)
+      (try
+        (when (.isDirectory entry)
+          ;; The modification time of an entry is the time it was last used
+          (.setLastModified entry (System/currentTimeMillis))
+          ;; Entries stored before the timings were left out may still hold them
+          (copy-dir! entry result-dir uncached-files)
+          true)
+        (finally
+          (.unlock lock))))))
+
+(defn store!
+  "Save the results in result-dir under key, without the timings of the run."
+  [key result-dir]
+  (when key
+    (let [entry (io/file cache-dir key)
+          temp (io/file cache-dir (str "." key "." (java.util.UUID/randomUUID)))]
+      (copy-dir! result-dir temp uncached-files)
+      ;; Another task may have stored the same results meanwhile
+      (if (.renameTo temp entry)
+        (evict!)
+        (delete-dir! temp)))))
+
+(defn call-protqc!
+  "protqc/call-protqc! with the result cache, the metric tables of a resubmission are reused."
+  [data-file metadata-file result-dir]
+  (let [key (try
+              (cache-key data-file metadata-file)
+              (catch Exception e
+                (log/warn "Cannot compute the cache key: " (.getMessage e))))]
+    (if (try
+          (restore! key result-dir)
+          (catch Exception e
+            (log/warn "Cannot restore the cached results, protqc is run: " (.getMessage e))))
+      (do (log/info (format "Reuse the cached results %s for %s" key data-file))
+          {:status "Success" :msg "" :cached true})
+      (let [result (protqc/call-protqc! data-file metadata-file result-dir)]
+        (when (= (:status result) "Success")
+          (try
+            (store! key result-dir)
+            (catch Exception e
+              (log/warn "Cannot cache the results: " (.getMessage e)))))
+        result))))
@@ -1,6 +1,7 @@
 (ns quartet-protqc-report.cli
   (:gen-class)
   (:require [quartet-protqc-report.task :refer [make-report!]]
+            [quartet-protqc-report.batch :refer [run-batch!]]
             [local-fs.core :refer [file? directory? exists?]]
             [clojure.string :as clj-str]
             [clojure.tools.cli :refer [parse-opts]]
@@ -18,6 +19,16 @@
     :default "report"]
    ["-D" "--description DESC" "Report Description"
     :default "Quality control report"]
+   ["-b" "--manifest PATH" "Manifest file (TSV or JSON) with the columns data, metadata, output, name & description"
+    :validate [#(file? %) "Must be a valid file."]]
+   ["-j" "--jobs N" "The number of reports generated in parallel with --manifest"
+    :default 1
+    :parse-fn #(Integer/parseInt %)
+    :validate [pos? "Must be a positive number."]]
+   ["-w" "--workers N" "The number of sample pairs of a report analysed in parallel for RC with --manifest"
+    :default 1
+    :parse-fn #(Integer/parseInt %)
+    :validate [pos? "Must be a positive number."]]
    ["-v" "--version" "Show version" :default false]
    ["-h" "--help"]])
 
@@ -25,6 +36,7 @@
   (->> ["Protqc - Visualizes Quality Control(QC) results for Quartet Project."
         ""
         "Usage: protqc [options]"
+        "       protqc -b MANIFEST [-j JOBS] [-w WORKERS]"
         ""
         "Options:"
         options-summary
@@ -53,6 +65,9 @@
       (:version options)
       {:exit-message (format "v%s" version)}
 
+      (:manifest options)
+      {:options options}
+
       (nil? (:data options))
       {:exit-message "You need to specified -d/--data argument."}
 
@@ -81,16 +96,22 @@
   (let [{:keys [options exit-message ok?]} (validate-args args)]
     (if exit-message
       (exit (if ok? 0 1) exit-message)
-      (let [result (make-report! {:data-file (:data options)
-                                  :metadata-file (:metadata options)
-                                  :dest-dir (:output options)
-                                  :metadata {:name (:name options)
-                                             :description (:description options)
-                                             :plugin-name "quartet-protqc-report"
-                                             :plutin-type "ReportPlugin"
-                                             :plugin-version version}
-                                  :task-id nil})]
-        (if (= (:status result) "Success")
-          (log/info (:msg result))
-          (log/error (:msg result)))))
+      (let [plugin-metadata {:plugin-name "quartet-protqc-report"
+                             :plutin-type "ReportPlugin"
+                             :plugin-version version}]
+        (if (:manifest options)
+          (doseq [result (run-batch! (:manifest options) (:jobs options) (:workers options) plugin-metadata)]
+            (if (= (:status result) "Success")
+              (log/info (format "%s: Success" (:output result)))
+              (log/error (format "%s: %s" (:output result) (:msg result)))))
+          (let [result (make-report! {:data-file (:data options)
+                                      :metadata-file (:metadata options)
+                                      :dest-dir (:output options)
+                                      :metadata (merge plugin-metadata
+                                                       {:name (:name options)
+                                                        :description (:description options)})
+                                      :task-id nil})]
+            (if (= (:status result) "Success")
+              (log/info (:msg result))
+              (log/error (:msg result)))))))
     (shutdown-agents)))
@@ -1,5 +1,6 @@
 (ns quartet-protqc-report.core
   (:require [tservice-core.tasks.http :as http-task]
+            [quartet-protqc-report.metrics :as metrics]
             [quartet-protqc-report.spec :as spec]
             [quartet-protqc-report.task :as task]))
 
@@ -13,3 +14,8 @@
                           :handler task/post-handler}))
 
 (def events-init task/events-init)
+
+(defn start-metrics-server!
+  "Called during startup, after events-init; serve the metrics if PROTQC_METRICS_PORT is set."
+  []
+  (metrics/start-server!))
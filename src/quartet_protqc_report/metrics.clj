@@ -0,0 +1,138 @@
+(ns quartet-protqc-report.metrics
+  "Stage timings and peak memory of the reports.
+
+   The metrics of a report are written to metrics.json next to its log file:
+   the wall time of each stage (protqc, information, multiqc), the peak RSS of the
+   R and MultiQC processes, the protqc stages (stage_timings.tsv) and the input sizes.
+
+   PROTQC_METRICS_PORT: Serve the metrics of the recent reports, aggregated by stage,
+                        as JSON on http://localhost:PORT/metrics (disabled by default). The server
+                        is started by the start-metrics-server! step of tservice-plugin.yaml."
+  (:require [clojure.data.csv :as csv]
+            [clojure.data.json :as json]
+            [clojure.java.io :as io]
+            [clojure.tools.logging :as log]
+            [local-fs.core :as fs-lib]
+            [quartet-protqc-report.scheduler :as scheduler])
+  (:import [com.sun.net.httpserver HttpExchange HttpHandler HttpServer]
+           [java.net InetSocketAddress]))
+
+;; The number of recent reports kept for the metrics endpoint
+(def ^:private max-recent 100)
+
+(defonce ^:private recent (atom clojure.lang.PersistentQueue/EMPTY))
+
+(defn timed
+  "Wrap a step of a report, the wall time of the step is added to stages (an atom)."
+  [stages stage f]
+  (fn []
+    (let [start (System/nanoTime)
+          result (f)]
+      (swap! stages conj (merge {:stage stage
+                                 :seconds (/ (Math/round (/ (- (System/nanoTime) start) 1e6)) 1e3)
+                                 :status (:status result)}
+                                (select-keys result [:cached])))
+      result)))
+
+(defn- parse-number
+  [value]
+  (try
+    (Double/parseDouble value)
+    (catch NumberFormatException _ nil)))
+
+(defn- read-protqc-stages
+  "The stages of protqc, see stage_timings.tsv in the result directory."
+  [result-dir]
+  (let [path (fs-lib/join-paths result-dir "stage_timings.tsv")]
+    (when (fs-lib/exists? path)
+      (with-open [reader (io/reader path)]
+        (let [[_ & rows] (doall (csv/read-csv reader :separator \tab))]
+          (mapv (fn [[stage seconds peak-rss]]
+                  {:stage stage
+                   :seconds (parse-number seconds)
+                   :peak_rss_mb (parse-number peak-rss)})
+                rows))))))
+
+(defn- read-multiqc-resources
+  [dest-dir]
+  (some (fn [data-dir]
+          (let [path (fs-lib/join-paths dest-dir data-dir "quartet_proteome_report_resources.json")]
+            (when (fs-lib/exists? path)
+              (json/read-str (slurp path) :key-fn keyword))))
+        ["multiqc_report_data" "multiqc_data"]))
+
+(defn- file-size
+  [path]
+  (when path
+    (.length (io/file path))))
+
+(defn- peak-rss
+  "Add the peak RSS of the R and MultiQC processes to their stages."
+  [stages protqc-stages multiqc-resources]
+  (let [protqc-peak (some->> (keep :peak_rss_mb protqc-stages) seq (apply max))]
+    (mapv (fn [{:keys [stage cached] :as record}]
+            (cond
+              (and (= stage "protqc") (not cached)) (assoc record :peak_rss_mb protqc-peak)
+              (= stage "multiqc") (assoc record :peak_rss_mb (:peak_rss_mb multiqc-resources))
+              :else record))
+          stages)))
+
+(defn write-metrics!
+  "Write metrics.json of a report into dest-dir and keep it for the metrics endpoint."
+  [{:keys [dest-dir result-dir task-id data-file metadata-file stages]}]
+  (let [protqc-stages (read-protqc-stages result-dir)
+        cached? (some :cached stages)
+        metrics {:task_id task-id
+                 :date (str (java.time.Instant/now))
+                 :input {:data_file_bytes (file-size data-file)
+                         :metadata_file_bytes (file-size metadata-file)}
+                 :stages (peak-rss stages protqc-stages (read-multiqc-resources dest-dir))
+                 ;; The protqc stages of a cached result are the ones of the original run
+                 :protqc_stages (when-not cached? protqc-stages)}]
+    (spit (fs-lib/join-paths dest-dir "metrics.json") (json/write-str metrics))
+    (swap! recent (fn [coll]
+                    (let [coll (conj coll metrics)]
+                      (if (> (count coll) max-recent) (pop coll) coll))))
+    metrics))
+
+(defn- summarize
+  [records]
+  (->> (group-by :stage records)
+       (map (fn [[stage records]]
+              (let [seconds (keep :seconds records)
+                    peak-rss (keep :peak_rss_mb records)]
+                [stage {:count (count records)
+                        :mean_seconds (when (seq seconds) (/ (reduce + seconds) (count seconds)))
+                        :max_seconds (when (seq seconds) (apply max seconds))
+                        :max_peak_rss_mb (when (seq peak-rss) (apply max peak-rss))}])))
+       (into (sorted-map))))
+
+(defn snapshot
+  "The metrics of the recent reports aggregated by stage, with the scheduler status."
+  []
+  (let [reports @recent]
+    {:reports (count reports)
+     :stages (summarize (mapcat :stages reports))
+     :protqc_stages (summarize (mapcat :protqc_stages reports))
+     :scheduler (scheduler/status)
+     :recent (vec (take-last 10 reports))}))
+
+(defonce ^:private server (atom nil))
+
+(defn start-server!
+  "Serve the metrics on PROTQC_METRICS_PORT, nothing happens if it's not set."
+  []
+  (when-let [port (System/getenv "PROTQC_METRICS_PORT")]
+    (when-not @server
+      (let [http-server (HttpServer/create (InetSocketAddress. (Integer/parseInt port)) 0)]
+        (.createContext http-server "/metrics"
+                        (reify HttpHandler
+                          (handle [_ ^HttpExchange exchange]
+                            (let [body (.getBytes ^String (json/write-str (snapshot)) "UTF-8")]
+                              (.add (.getResponseHeaders exchange) "Content-Type" "application/json")
+                              (.sendResponseHeaders exchange 200 (alength body))
+                              (with-open [out (.getResponseBody exchange)]
+                                (.write out body))))))
+        (.start http-server)
+        (reset! server http-server)
+        (log/info "Serve the metrics on port " port)))))
@@ -6,17 +6,14 @@
             [tservice-core.plugins.util :refer [call-command!]]
             [tservice-core.plugins.env :refer [get-context-path add-env-to-path]]
             [clojure.tools.logging :as log]
+            [quartet-protqc-report.render :as render]
+            [quartet-protqc-report.worker :as worker]
             [quartet-protqc-report.version :as v]))
 
-(defn call-protqc!
-  "Call protqc bash script. more details on https://github.com/chinese-quartet/ProtQC
-   exp-file: Proteomics profiled data. 
-   meta-file: proteomics metadata.
-   result-dir: A directory for result files."
-  [exp-file meta-file result-dir]
-  (let [command ["bash" "-c"
-                 (format "protqc.sh -d %s -m %s -o %s" exp-file meta-file result-dir)]
-        rprofile (fs-lib/join-paths (get-context-path :env v/plugin-name) "Rprofile")
+(defn protqc-env
+  "The environment for running protqc.sh & Rscript."
+  []
+  (let [rprofile (fs-lib/join-paths (get-context-path :env v/plugin-name) "Rprofile")
         path (add-env-to-path v/plugin-name)
         ;; When you are in local mode, the context-path doesn't exist.
         rprofile (if (= rprofile (format "%s/Rprofile" v/plugin-name))
@@ -27,18 +24,74 @@
                path)]
     (log/info "PATH variable: " path)
     (log/info "Rprofile file is in " rprofile)
-    (shell/with-sh-env {:PATH   path
-                        :R_PROFILE_USER rprofile
-                        :LC_ALL "en_US.utf-8"
-                        :LANG   "en_US.utf-8"}
-      (let [result (apply sh command)]
-        {:status (if (= (:exit result) 0) "Success" "Error")
-         :msg (str (:out result) "\n" (:err result))}))))
+    (cond-> {:PATH   path
+             :R_PROFILE_USER rprofile
+             :LC_ALL "en_US.utf-8"
+             :LANG   "en_US.utf-8"
+             ;; tsv or feather, the format of the result tables
+             :PROTQC_OUTPUT_FORMAT (or (System/getenv "PROTQC_OUTPUT_FORMAT") "tsv")}
+      ;; SNR from a randomized PCA, in both engines
+      (System/getenv "PROTQC_RANDOMIZED_PCA") (assoc :PROTQC_RANDOMIZED_PCA (System/getenv "PROTQC_RANDOMIZED_PCA")))))
+
+(defn call-protqc!
+  "Call protqc bash script. more details on https://github.com/chinese-quartet/ProtQC
+   exp-file: Proteomics profiled data. 
+   meta-file: proteomics metadata.
+   result-dir: A directory for result files.
+
+   The job runs on a warm R worker (see quartet-protqc-report.worker) unless
+   the pool is disabled by PROTQC_R_WORKERS=0."
+  [exp-file meta-file result-dir]
+  (if (worker/enabled?)
+    (worker/run-job! (protqc-env) exp-file meta-file result-dir)
+    (let [command ["bash" "-c"
+                   (format "protqc.sh -d %s -m %s -o %s" exp-file meta-file result-dir)]]
+      (shell/with-sh-env (protqc-env)
+        (let [result (apply sh command)]
+          {:status (if (= (:exit result) 0) "Success" "Error")
+           :msg (str (:out result) "\n" (:err result))})))))
+
+(defn- read-status-file
+  "Read the status file written by protqc.sh -b: result-dir -> {:status :msg}"
+  [status-file]
+  (->> (rest (clj-str/split-lines (slurp status-file)))
+       (map #(clj-str/split % #"\t" -1))
+       (map (fn [[result-dir status msg]]
+              [result-dir {:status status :msg (or msg "")}]))
+       (into {})))
+
+(defn call-protqc-batch!
+  "Call protqc bash script once for many submissions, protqc and its datasets are loaded once.
+   entries: A collection of maps with :data-file, :metadata-file and :result-dir.
+   jobs: The number of entries processed in parallel.
+   workers: The number of sample pairs of an entry analysed in parallel for RC.
+
+   Returns a map from the result-dir of each entry to {:status :msg}."
+  [entries jobs workers]
+  (let [manifest (str (java.io.File/createTempFile "protqc-manifest" ".tsv"))
+        status-file (str manifest ".status")
+        lines (map (fn [{:keys [data-file metadata-file result-dir]}]
+                     (clj-str/join "\t" [data-file metadata-file result-dir]))
+                   entries)]
+    (spit manifest (str (clj-str/join "\n" (cons "data_file\tmetadata_file\tresult_dir" lines)) "\n"))
+    (let [result (shell/with-sh-env (protqc-env)
+                   ;; protqc.sh is found on the PATH of protqc-env, the arguments are passed as is
+                   (sh "bash" "-c" "protqc.sh \"$@\"" "protqc.sh"
+                       "-b" manifest "-j" (str jobs) "-w" (str workers)))
+          statuses (if (fs-lib/exists? status-file) (read-status-file status-file) {})
+          failure {:status "Error"
+                   :msg (str (:out result) "\n" (:err result))}]
+      (into {} (map (fn [{:keys [result-dir]}]
+                      [result-dir (get statuses result-dir failure)])
+                    entries)))))
 
 (defn multiqc
   "A multiqc wrapper for generating multiqc report:
    TODO: set the absolute path of multiqc binary instead of environment variable
 
+  The report is rendered by the render service (see quartet-protqc-report.render), the multiqc
+  command is only run when the service is disabled or not available.
+
   Required:
   analysis-dir: Analysis directory, e.g. data directory from project
   outdir: Create report in the specified output directory.
@@ -84,9 +137,15 @@
         command (clj-str/join " " multiqc-command)]
     (if dry-run?
       (log/info command)
-      (if env
-        (call-command! command env)
-        (call-command! command)))))
+      ;; The render service always overwrites the existing reports
+      (or (when (and force? (render/enabled?))
+            (render/render! analysis-dir outdir
+                            {:title title :comment comment :filename filename
+                             :template template :config config :dirs prepend-dirs?}
+                            env))
+          (if env
+            (call-command! command env)
+            (call-command! command))))))
 
 (defn is-localpath?
   [filepath]
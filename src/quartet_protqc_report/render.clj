@@ -0,0 +1,122 @@
+(ns quartet-protqc-report.render
+  "A MultiQC render service (python -m quartet_proteome_report.service), MultiQC & the plugin
+   are imported once by the service instead of once per report.
+
+   PROTQC_RENDER_SERVICE: 0 renders the reports with the multiqc command instead (1 by default).
+   PROTQC_RENDER_TIMEOUT: A render is failed after the number of seconds (1800 by default)."
+  (:require [clojure.data.json :as json]
+            [clojure.java.io :as io]
+            [clojure.string :as clj-str]
+            [clojure.tools.logging :as log])
+  (:import [java.lang ProcessBuilder$Redirect]
+           [java.net HttpURLConnection SocketTimeoutException URL]))
+
+(def ^:private service-enabled
+  (not= (System/getenv "PROTQC_RENDER_SERVICE") "0"))
+
+;; Importing MultiQC, pandas & plotly takes a few seconds
+(def ^:private start-timeout 120000)
+
+(def ^:private ping-timeout 10000)
+
+(def ^:private render-timeout
+  (Integer/parseInt (or (System/getenv "PROTQC_RENDER_TIMEOUT") "1800")))
+
+;; {:process :port} of the running service
+(defonce ^:private service (atom nil))
+
+(defn enabled?
+  []
+  service-enabled)
+
+(defn- http-request
+  "Send a request to the service, returns the JSON reply. timeout (ms)."
+  [port method path body timeout]
+  (let [conn ^HttpURLConnection (.openConnection (URL. (format "http://127.0.0.1:%d%s" port path)))]
+    (.setRequestMethod conn method)
+    (.setConnectTimeout conn ping-timeout)
+    (.setReadTimeout conn (int timeout))
+    (when body
+      (.setDoOutput conn true)
+      (.setRequestProperty conn "Content-Type" "application/json")
+      (with-open [out (.getOutputStream conn)]
+        (.write out (.getBytes ^String (json/write-str body) "UTF-8"))))
+    (let [stream (if (< (.getResponseCode conn) 400)
+                   (.getInputStream conn)
+                   (.getErrorStream conn))]
+      (json/read-str (slurp stream) :key-fn keyword))))
+
+(defn- stop-service!
+  [{:keys [^Process process]}]
+  (log/info "Stop the render service " (.hashCode process))
+  (.destroy process)
+  (when-not (.waitFor process 5 java.util.concurrent.TimeUnit/SECONDS)
+    (.destroyForcibly process)))
+
+(defn shutdown!
+  "Stop the render service."
+  []
+  (when-let [running (first (reset-vals! service nil))]
+    (stop-service! running)))
+
+(defonce ^:private shutdown-hook
+  (delay (.addShutdownHook (Runtime/getRuntime) (Thread. ^Runnable shutdown!))))
+
+(defn- start-service!
+  [env]
+  @shutdown-hook
+  (let [builder (doto (ProcessBuilder. ^java.util.List ["bash" "-c" "python -m quartet_proteome_report.service -p 0"])
+                  (.redirectError ProcessBuilder$Redirect/INHERIT))
+        _ (doseq [[k v] env :when v]
+            (.put (.environment builder) (name k) (str v)))
+        process (.start builder)
+        reader (io/reader (.getInputStream process))
+        ready (deref (future (.readLine ^java.io.BufferedReader reader)) start-timeout nil)]
+    (log/info "Start the render service " (.hashCode process))
+    (if (and ready (clj-str/starts-with? ready "READY "))
+      {:process process
+       :port (Integer/parseInt (clj-str/trim (subs ready 6)))}
+      (do (stop-service! {:process process})
+          (throw (ex-info "The render service failed to start." {}))))))
+
+(defn- healthy?
+  [{:keys [^Process process port]}]
+  (and (.isAlive process)
+       (try
+         (= (:status (http-request port "GET" "/ping" nil ping-timeout)) "OK")
+         (catch java.io.IOException _ false))))
+
+(defn- ensure-service!
+  "The running service, a new one is started if there is none or it's unhealthy."
+  [env]
+  (locking service
+    (let [running @service]
+      (if (and running (healthy? running))
+        running
+        (do (when running
+              (log/warn "The render service " (.hashCode ^Process (:process running)) " is unhealthy.")
+              (stop-service! running))
+            (reset! service (start-service! env)))))))
+
+(defn render!
+  "Render the MultiQC report of analysis-dir into outdir on the service.
+   options: :title, :comment, :filename, :template, :config & :dirs, see quartet_proteome_report.service.
+   env: The environment of the service process.
+
+   Returns {:status :msg}, nil if the service is not available. A render which
+   doesn't reply within render-timeout is failed, the service keeps running."
+  [analysis-dir outdir options env]
+  (try
+    (let [{:keys [port]} (ensure-service! env)]
+      (http-request port "POST" "/render"
+                    (merge (into {} (remove (comp nil? val) options))
+                           {:analysis_dir analysis-dir
+                            :outdir outdir})
+                    (* 1000 render-timeout)))
+    (catch SocketTimeoutException _
+      (log/warn "The render of " analysis-dir " didn't finish within " render-timeout " seconds.")
+      {:status "Error" :msg (format "The render didn't finish within %d seconds." render-timeout)})
+    (catch Exception e
+      (log/warn "The render service is not available: " (.getMessage e))
+      (shutdown!)
+      nil)))
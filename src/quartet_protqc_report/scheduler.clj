@@ -0,0 +1,142 @@
+(ns quartet-protqc-report.scheduler
+  "A bounded scheduler for the report tasks.
+
+   Tasks wait in priority lanes (interactive before bulk, first in first out in a lane), the
+   first waiting task starts when a slot is free and its memory estimate fits in the budget.
+
+   PROTQC_MAX_TASKS: The maximum number of running tasks (2 by default).
+   PROTQC_MAX_MEMORY: The memory budget of the running tasks in MB (half of the physical
+                      memory by default). A task larger than the budget runs alone."
+  (:require [clojure.java.io :as io]
+            [clojure.tools.logging :as log])
+  (:import [clojure.lang PersistentQueue]
+           [java.lang.management ManagementFactory]
+           [java.util.concurrent ExecutorService Executors]))
+
+(def lanes
+  "Priority lanes, from the highest to the lowest priority."
+  [:interactive :bulk])
+
+(defn- physical-memory
+  "The physical memory in MB, 16384 if unknown."
+  []
+  (let [bean (ManagementFactory/getOperatingSystemMXBean)]
+    (if (instance? com.sun.management.OperatingSystemMXBean bean)
+      (quot (.getTotalPhysicalMemorySize ^com.sun.management.OperatingSystemMXBean bean) 1048576)
+      16384)))
+
+(def max-tasks
+  (Integer/parseInt (or (System/getenv "PROTQC_MAX_TASKS") "2")))
+
+(def max-memory
+  (if-let [value (System/getenv "PROTQC_MAX_MEMORY")]
+    (Long/parseLong value)
+    (quot (physical-memory) 2)))
+
+(defn estimate-memory
+  "Estimate the peak memory (MB) of a report from the size of its data file,
+   R keeps several expanded copies of the matrix (imputation, voom, prcomp)."
+  [data-file]
+  (let [size (/ (.length (io/file data-file)) 1048576.0)]
+    (long (+ 512 (* 40 size)))))
+
+(defonce ^:private lock (Object.))
+
+(defonce ^:private state
+  (atom {:queues (zipmap lanes (repeat PersistentQueue/EMPTY))
+         :running 0
+         :memory 0}))
+
+(defonce ^:private ^ExecutorService executor (Executors/newCachedThreadPool))
+
+(defn- waiting-tasks
+  [state]
+  (mapcat #(get-in state [:queues %]) lanes))
+
+(defn status
+  "The number of running & waiting tasks and the memory reserved by the running tasks."
+  []
+  (let [state @state]
+    {:running (:running state)
+     :memory (:memory state)
+     :waiting (into {} (map (fn [lane] [lane (count (get-in state [:queues lane]))]) lanes))}))
+
+(defn- fits?
+  [{:keys [running memory]} task]
+  (and (< running max-tasks)
+       (or (zero? running)
+           (<= (+ memory (:memory task)) max-memory))))
+
+(defn- notify-waiting!
+  "Call on-wait of the waiting tasks whose position changed since they were last notified."
+  [state]
+  (doseq [[position task] (map-indexed vector (waiting-tasks state))
+          :let [position (inc position)]
+          :when (not= (first (reset-vals! (:position task) position)) position)]
+    (try
+      ((:on-wait task) position)
+      (catch Exception e
+        (log/warn "Cannot update the queue position of " (:id task) ": " (.getMessage e))))))
+
+(declare dispatch!)
+
+(defn- start!
+  [task]
+  (.submit executor
+           ^Runnable
+           (fn []
+             (try
+               ;; A failure to record the start must not keep the task from running
+               (try
+                 ((:on-start task) (- (System/currentTimeMillis) (:queued-at task)))
+                 (catch Exception e
+                   (log/warn "Cannot record the start of " (:id task) ": " (.getMessage e))))
+               ((:run task))
+               (catch Throwable e
+                 (log/error "The task " (:id task) " failed: " e))
+               (finally
+                 (locking lock
+                   (swap! state #(-> %
+                                     (update :running dec)
+                                     (update :memory - (:memory task)))))
+                 (dispatch!))))))
+
+(defn- dispatch!
+  "Start the waiting tasks in order, until the first one that doesn't fit."
+  []
+  (let [[started waiting] (locking lock
+                          (loop [started []]
+                            (let [current @state
+                                  task (first (waiting-tasks current))]
+                              (if (and task (fits? current task))
+                                (do (swap! state #(-> %
+                                                      (update-in [:queues (:lane task)] pop)
+                                                      (update :running inc)
+                                                      (update :memory + (:memory task))))
+                                    (recur (conj started task)))
+                                [started current]))))]
+    (doseq [task started]
+      (log/info (format "Start the task %s (%s, %d MB)" (:id task) (name (:lane task)) (:memory task)))
+      (start! task))
+    (notify-waiting! waiting)))
+
+(defn submit!
+  "Queue a task.
+   task: A map with
+     :id        The task id, only used in logs.
+     :lane      One of lanes, :interactive by default.
+     :memory    The memory estimate in MB, see estimate-memory.
+     :run       The function running the task.
+     :on-wait   Called with the (1-based) queue position whenever it changes.
+     :on-start  Called with the waiting time (ms) when the task starts."
+  [{:keys [lane] :as task}]
+  (let [lane (if (some #{lane} lanes) lane :interactive)
+        task (merge {:on-wait (fn [_]) :on-start (fn [_])}
+                    task
+                    {:lane lane
+                     :queued-at (System/currentTimeMillis)
+                     ;; The last position passed to on-wait
+                     :position (atom nil)})]
+    (locking lock
+      (swap! state update-in [:queues lane] conj task))
+    (dispatch!)))
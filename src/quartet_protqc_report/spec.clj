@@ -34,7 +34,15 @@
     :swagger/default     ""
     :reason              "Not a valid description."}))
 
+(s/def ::priority
+  (st/spec
+   {:spec                #{"interactive" "bulk"}
+    :type                :string
+    :description         "The queue of the report, interactive (default) or bulk"
+    :swagger/default     "interactive"
+    :reason              "The priority must be interactive or bulk."}))
+
 (def quartet-protqc-report-params-body
   "A spec for the body parameters."
   (s/keys :req-un [::name ::data_file ::metadata_file]
-          :opt-un [::description]))
+          :opt-un [::description ::priority]))
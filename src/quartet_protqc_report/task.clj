@@ -1,5 +1,8 @@
 (ns quartet-protqc-report.task
   (:require [quartet-protqc-report.protqc :as protqc]
+            [quartet-protqc-report.cache :as cache]
+            [quartet-protqc-report.scheduler :as scheduler]
+            [quartet-protqc-report.metrics :as metrics]
             [local-fs.core :as fs-lib]
             [tservice-core.plugins.env :refer [make-remote-link add-env-to-path create-task! update-task!]]
             [tservice-core.plugins.util :as util]
@@ -35,8 +38,9 @@
   [{:keys [body owner plugin-context uuid workdir]
     :as payload}]
   (log/info (format "Create a report with %s" payload))
-  (let [{:keys [name data_file metadata_file description]
-         :or {description (format "Quality control report for %s" name)}} body
+  (let [{:keys [name data_file metadata_file description priority]
+         :or {description (format "Quality control report for %s" name)
+              priority "interactive"}} body
         payload (merge {:description description} (:body payload))
         data-file (protqc/correct-filepath data_file)
         metadata-file (protqc/correct-filepath metadata_file)
@@ -60,6 +64,8 @@
                      :metadata-file metadata-file
                      :dest-dir workdir
                      :task-id task-id
+                     :priority priority
+                     :response response
                      :metadata {:name name
                                 :description description
                                 :plugin-name v/plugin-name
@@ -67,32 +73,31 @@
                                 :plugin-version (:plugin-version plugin-context)}})
     response))
 
-(defn make-report!
-  [{:keys [data-file metadata-file dest-dir metadata task-id]}]
-  (fs-lib/create-directories! (fs-lib/join-paths dest-dir "results"))
+(defn write-information!
+  "Write general_information.json of a report into the result directory."
+  [result-dir metadata]
+  (spit (fs-lib/join-paths result-dir "general_information.json")
+        (json/write-str {"Report Name" (:name metadata)
+                         "Description" (:description metadata)
+                         "Report Tool" (format "%s-%s"
+                                               (:plugin-name metadata)
+                                               (:plugin-version metadata))
+                         "Team" "Quartet Team"
+                         "Date" (date)}))
+  {:status "Success" :msg ""})
+
+(defn render-report!
+  "Render the MultiQC report of the result directory into dest-dir."
+  [result-dir dest-dir]
+  (protqc/multiqc result-dir dest-dir
+                  {:template "report_templates"
+                   :title "Quartet Report for Proteomics"
+                   :env {:PATH (add-env-to-path "quartet-protqc-report")}}))
+
+(defn finish-report!
+  "Write the log file of a report from the results of its steps."
+  [dest-dir results task-id]
   (let [log-path (fs-lib/join-paths dest-dir "log")
-        result-dir (fs-lib/join-paths dest-dir "results")
-        parameters-file (fs-lib/join-paths result-dir "general_information.json")
-        results (util/chain-fn-coll [(fn []
-                                       (update-process! task-id 20)
-                                       (protqc/call-protqc! data-file metadata-file result-dir))
-                                     (fn []
-                                       (update-process! task-id 50)
-                                       (spit parameters-file (json/write-str {"Report Name" (:name metadata)
-                                                                              "Description" (:description metadata)
-                                                                              "Report Tool" (format "%s-%s"
-                                                                                                    (:plugin-name metadata)
-                                                                                                    (:plugin-version metadata))
-                                                                              "Team" "Quartet Team"
-                                                                              "Date" (date)}))
-                                       {:status "Success" :msg ""})
-                                     (fn []
-                                       (update-process! task-id 80)
-                                       (protqc/multiqc result-dir dest-dir
-                                                       {:template "report_templates"
-                                                        :title "Quartet Report for Proteomics"
-                                                        :env {:PATH (add-env-to-path "quartet-protqc-report")}}))]
-                                    (fn [result] (= (:status result) "Success")))
         status (:status (last results))
         msg (apply str (map :msg results))
         process (if (= status "Success") 100 -1)
@@ -102,6 +107,63 @@
                          task-id process)
     output))
 
+(defn make-report!
+  [{:keys [data-file metadata-file dest-dir metadata task-id]}]
+  (fs-lib/create-directories! (fs-lib/join-paths dest-dir "results"))
+  (let [result-dir (fs-lib/join-paths dest-dir "results")
+        stages (atom [])
+        results (util/chain-fn-coll [(metrics/timed stages "protqc"
+                                                    (fn []
+                                                      (update-process! task-id 20)
+                                                      (cache/call-protqc! data-file metadata-file result-dir)))
+                                     (metrics/timed stages "information"
+                                                    (fn []
+                                                      (update-process! task-id 50)
+                                                      (write-information! result-dir metadata)))
+                                     (metrics/timed stages "multiqc"
+                                                    (fn []
+                                                      (update-process! task-id 80)
+                                                      (render-report! result-dir dest-dir)))]
+                                    (fn [result] (= (:status result) "Success")))]
+    (try
+      (metrics/write-metrics! {:dest-dir dest-dir
+                               :result-dir result-dir
+                               :task-id task-id
+                               :data-file data-file
+                               :metadata-file metadata-file
+                               :stages @stages})
+      (catch Exception e
+        (log/warn "Cannot write the metrics: " (.getMessage e))))
+    (finish-report! dest-dir results task-id)))
+
+(defn- update-queue!
+  "Record the queue information of a task in its response."
+  [task-id response queue]
+  (update-task! {:id task-id
+                 :response (assoc response :queue queue)}))
+
+(defn schedule-report!
+  "Queue a report in the scheduler, the queue position and the waiting time are
+   recorded in the task."
+  [{:keys [data-file task-id priority response] :as event}]
+  (let [lane (keyword (or priority "interactive"))
+        queued-time (util/time->int (util/now))]
+    (scheduler/submit! {:id task-id
+                        :lane lane
+                        :memory (scheduler/estimate-memory data-file)
+                        :run #(make-report! event)
+                        :on-wait (fn [position]
+                                   (update-queue! task-id response
+                                                  {:lane (name lane)
+                                                   :position position
+                                                   :queued_time queued-time}))
+                        :on-start (fn [wait]
+                                    (update-queue! task-id response
+                                                   {:lane (name lane)
+                                                    :position 0
+                                                    :queued_time queued-time
+                                                    :wait_seconds (quot wait 1000)}))})))
+
 (def events-init
   "Automatically called during startup; start event listener for quartet_protqc_report events."
-  (make-events-init "quartet_protqc_report" make-report!))
+  (make-events-init "quartet_protqc_report" schedule-report!))
@@ -0,0 +1,145 @@
+(ns quartet-protqc-report.worker
+  "A pool of warm R workers (protqc.sh -s), protqc & its datasets are loaded once per worker.
+
+   PROTQC_R_WORKERS: The maximum number of workers, 0 disables the pool (2 by default).
+   PROTQC_R_MAX_JOBS: A worker is recycled after the number of jobs (20 by default).
+   PROTQC_R_JOB_TIMEOUT: A job is failed and its worker stopped after the number of seconds,
+                         0 waits forever (3600 by default)."
+  (:require [clojure.java.io :as io]
+            [clojure.string :as clj-str]
+            [clojure.tools.logging :as log])
+  (:import [java.lang ProcessBuilder$Redirect]
+           [java.util.concurrent LinkedBlockingQueue Semaphore]))
+
+(defn- env-int
+  [name default]
+  (if-let [value (System/getenv name)]
+    (Integer/parseInt value)
+    default))
+
+(def pool-size (env-int "PROTQC_R_WORKERS" 2))
+
+(def max-jobs (env-int "PROTQC_R_MAX_JOBS" 20))
+
+(def job-timeout (env-int "PROTQC_R_JOB_TIMEOUT" 3600))
+
+;; Loading protqc & the datasets takes a while on a cold start
+(def ^:private start-timeout 300000)
+
+(def ^:private ping-timeout 10000)
+
+(defonce ^:private idle-workers (LinkedBlockingQueue.))
+
+(defonce ^:private slots (Semaphore. (max pool-size 1) true))
+
+(defn enabled?
+  []
+  (pos? pool-size))
+
+(defn- read-reply
+  "Read one line of a worker, nil if the worker exits, :timeout if it doesn't reply within timeout (ms)."
+  [{:keys [reader]} timeout]
+  (let [reply (future (.readLine ^java.io.BufferedReader reader))]
+    (if timeout
+      (deref reply timeout :timeout)
+      @reply)))
+
+(defn- request!
+  [{:keys [writer] :as worker} line timeout]
+  (.write ^java.io.Writer writer (str line "\n"))
+  (.flush ^java.io.Writer writer)
+  (read-reply worker timeout))
+
+(defn- stop-worker!
+  [{:keys [^Process process writer] :as worker}]
+  (log/info "Stop the R worker " (.hashCode process))
+  (try
+    (when (.isAlive process)
+      (.write ^java.io.Writer writer "QUIT\n")
+      (.close ^java.io.Writer writer))
+    (catch java.io.IOException _ nil))
+  (when-not (.waitFor process 5 java.util.concurrent.TimeUnit/SECONDS)
+    (.destroyForcibly process))
+  worker)
+
+(defn shutdown!
+  "Stop all idle workers."
+  []
+  (loop [worker (.poll ^LinkedBlockingQueue idle-workers)]
+    (when worker
+      (stop-worker! worker)
+      (recur (.poll ^LinkedBlockingQueue idle-workers)))))
+
+(defonce ^:private shutdown-hook
+  (delay (.addShutdownHook (Runtime/getRuntime) (Thread. ^Runnable shutdown!))))
+
+(defn- start-worker!
+  [env]
+  @shutdown-hook
+  (let [builder (doto (ProcessBuilder. ^java.util.List ["bash" "-c" "protqc.sh -s"])
+                  (.redirectError ProcessBuilder$Redirect/INHERIT))
+        _ (doseq [[k v] env :when v]
+            (.put (.environment builder) (name k) (str v)))
+        process (.start builder)
+        worker {:process process
+                :reader (io/reader (.getInputStream process))
+                :writer (io/writer (.getOutputStream process))
+                :jobs (atom 0)}]
+    (log/info "Start the R worker " (.hashCode process))
+    (if (= (read-reply worker start-timeout) "READY")
+      worker
+      (do (stop-worker! worker)
+          (throw (ex-info "The R worker failed to start." {}))))))
+
+(defn- healthy?
+  [{:keys [^Process process] :as worker}]
+  (and (.isAlive process)
+       (= (request! worker "PING" ping-timeout) "PONG")))
+
+(defn- acquire-worker!
+  "Take a healthy idle worker, or start a new one."
+  [env]
+  (loop [worker (.poll ^LinkedBlockingQueue idle-workers)]
+    (cond
+      (nil? worker) (start-worker! env)
+      (healthy? worker) worker
+      :else (do (log/warn "The R worker " (.hashCode ^Process (:process worker)) " is unhealthy.")
+                (stop-worker! worker)
+                (recur (.poll ^LinkedBlockingQueue idle-workers))))))
+
+(defn- release-worker!
+  [worker]
+  (if (>= (swap! (:jobs worker) inc) max-jobs)
+    (stop-worker! worker)
+    (.offer ^LinkedBlockingQueue idle-workers worker)))
+
+(defn- parse-reply
+  [reply]
+  (cond
+    (nil? reply) {:status "Error" :msg "The R worker exited unexpectedly."}
+    (= reply :timeout) {:status "Error" :msg (format "The R job didn't finish within %d seconds." job-timeout)}
+    (= reply "OK") {:status "Success" :msg ""}
+    :else {:status "Error" :msg (second (clj-str/split reply #"\t" 2))}))
+
+(defn run-job!
+  "Run protqc::qc_conclusion on a warm worker, at most pool-size jobs run at once.
+   A worker which doesn't reply within job-timeout is stopped, its slot is freed.
+   env: The environment of the worker processes, see protqc/protqc-env."
+  [env exp-file meta-file result-dir]
+  (.acquire ^Semaphore slots)
+  (try
+    (let [worker (acquire-worker! env)
+          reply (try
+                  (request! worker (clj-str/join "\t" ["RUN" exp-file meta-file result-dir])
+                            (when (pos? job-timeout) (* job-timeout 1000)))
+                  (catch java.io.IOException _ nil))]
+      (when (= reply :timeout)
+        (log/warn "The R worker " (.hashCode ^Process (:process worker)) " timed out on " result-dir))
+      (if (string? reply)
+        (release-worker! worker)
+        (stop-worker! worker))
+      (parse-reply reply))
+    (catch Exception e
+      {:status "Error" :msg (.getMessage e)})
+    (finally
+      (.release ^Semaphore slots))))
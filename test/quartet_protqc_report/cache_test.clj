@@ -0,0 +1,41 @@
+(ns quartet-protqc-report.cache-test
+  (:require [clojure.java.io :as io]
+            [clojure.java.shell :as shell]
+            [clojure.test :refer [deftest is testing]]
+            [quartet-protqc-report.cache :as cache]
+            [quartet-protqc-report.protqc :as protqc])
+  (:import [java.nio.file Files]
+           [java.nio.file.attribute FileAttribute]))
+
+(defn- temp-dir
+  []
+  (str (Files/createTempDirectory "protqc-cache" (make-array FileAttribute 0))))
+
+(deftest the-version-is-retried-until-known
+  (let [calls (atom 0)]
+    (reset! @#'cache/known-version nil)
+    (with-redefs [protqc/protqc-env (constantly {})
+                  shell/sh (fn [& _]
+                             (if (= (swap! calls inc) 1)
+                               {:exit 1 :out "" :err "Rscript: not found"}
+                               {:exit 0 :out "0.1.9\tabc\n" :err ""}))]
+      (is (nil? (#'cache/protqc-version)))
+      (testing "a failure is not kept"
+        (is (= "0.1.9\tabc" (#'cache/protqc-version))))
+      (testing "the version is kept once known"
+        (is (= "0.1.9\tabc" (#'cache/protqc-version)))
+        (is (= 2 @calls))))
+    (reset! @#'cache/known-version nil)))
+
+(deftest stored-results-leave-out-the-timings
+  (let [result-dir (temp-dir)
+        restored-dir (temp-dir)]
+    (spit (io/file result-dir "conclusion_table.tsv") "metrics")
+    (spit (io/file result-dir "stage_timings.tsv") "stage\tseconds\tpeak_rss_mb\n")
+    (with-redefs [cache/cache-dir (temp-dir)]
+      (cache/store! "key" result-dir)
+      (is (not (.exists (io/file cache/cache-dir "key" "stage_timings.tsv"))))
+      (is (true? (cache/restore! "key" restored-dir)))
+      (is (= "metrics" (slurp (io/file restored-dir "conclusion_table.tsv"))))
+      (is (not (.exists (io/file restored-dir "stage_timings.tsv"))))
+      (is (nil? (cache/restore! "other-key" restored-dir))))))
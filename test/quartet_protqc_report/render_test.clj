@@ -0,0 +1,73 @@
+(ns quartet-protqc-report.render-test
+  (:require [clojure.test :refer [deftest is testing]]
+            [quartet-protqc-report.protqc :as protqc]
+            [quartet-protqc-report.render :as render]
+            [tservice-core.plugins.util :as util])
+  (:import [java.net SocketTimeoutException]))
+
+(defn- multiqc!
+  "Run protqc/multiqc, returns [result render-calls commands]."
+  [render-reply & [options]]
+  (let [renders (atom [])
+        commands (atom [])]
+    (with-redefs [render/render! (fn [analysis-dir outdir options env]
+                                   (swap! renders conj [analysis-dir outdir options env])
+                                   render-reply)
+                  util/call-command! (fn [command & _]
+                                       (swap! commands conj command)
+                                       {:status "Success" :msg "multiqc"})]
+      [(protqc/multiqc "analysis" "report" (merge {:title "Quartet" :comment ""} options))
+       @renders
+       @commands])))
+
+(deftest the-service-renders-the-report
+  (with-redefs [render/enabled? (constantly true)]
+    (let [[result renders commands] (multiqc! {:status "Success" :msg ""})]
+      (is (= {:status "Success" :msg ""} result))
+      (is (= [["analysis" "report"
+               {:title "Quartet" :comment "" :filename "multiqc_report.html"
+                :template "default" :config nil :dirs false}
+               nil]]
+             renders))
+      (is (empty? commands)))))
+
+(deftest failed-renders-are-not-rerun
+  (with-redefs [render/enabled? (constantly true)]
+    (let [[result _ commands] (multiqc! {:status "Error" :msg "The render didn't finish within 1 seconds."})]
+      (is (= "Error" (:status result)))
+      (is (empty? commands)))))
+
+(deftest the-command-runs-without-the-service
+  (with-redefs [render/enabled? (constantly true)]
+    (testing "the service is not available"
+      (let [[result renders commands] (multiqc! nil)]
+        (is (= {:status "Success" :msg "multiqc"} result))
+        (is (= 1 (count renders)))
+        (is (= 1 (count commands)))
+        (is (re-find #"^multiqc --force .* -t default analysis$" (first commands))))))
+  (testing "the service is disabled"
+    (with-redefs [render/enabled? (constantly false)]
+      (let [[result renders commands] (multiqc! {:status "Success" :msg ""})]
+        (is (= {:status "Success" :msg "multiqc"} result))
+        (is (empty? renders))
+        (is (= 1 (count commands))))))
+  (testing "the reports are not overwritten, the service always does"
+    (with-redefs [render/enabled? (constantly true)]
+      (let [[_ renders commands] (multiqc! {:status "Success" :msg ""} {:force? false})]
+        (is (empty? renders))
+        (is (= 1 (count commands)))))))
+
+(deftest render-replies-nil-when-the-service-is-not-available
+  (let [stopped (atom 0)]
+    (with-redefs [render/ensure-service! (fn [_] (throw (ex-info "The render service failed to start." {})))
+                  render/shutdown! #(swap! stopped inc)]
+      (is (nil? (render/render! "analysis" "report" {} {})))
+      (is (= 1 @stopped)))))
+
+(deftest renders-time-out
+  (with-redefs [render/ensure-service! (constantly {:port 1})
+                render/render-timeout 1
+                render/http-request (fn [& _] (throw (SocketTimeoutException. "Read timed out")))
+                render/shutdown! #(throw (AssertionError. "the service is kept"))]
+    (is (= {:status "Error" :msg "The render didn't finish within 1 seconds."}
+           (render/render! "analysis" "report" {:title "Quartet"} {})))))
@@ -0,0 +1,80 @@
+(ns quartet-protqc-report.scheduler-test
+  (:require [clojure.test :refer [deftest is testing]]
+            [quartet-protqc-report.scheduler :as scheduler]))
+
+(defn- wait-until
+  "Wait up to 10 s for (f) to be true."
+  [f]
+  (loop [tries 200]
+    (cond
+      (f) true
+      (zero? tries) false
+      :else (do (Thread/sleep 50) (recur (dec tries))))))
+
+(defn- idle?
+  []
+  (let [{:keys [running waiting]} (scheduler/status)]
+    (and (zero? running) (every? zero? (vals waiting)))))
+
+(defn- submit!
+  "Submit a task which records its start in started and runs until its gate is delivered."
+  [started id lane memory & [positions]]
+  (let [gate (promise)]
+    (scheduler/submit! {:id id
+                        :lane lane
+                        :memory memory
+                        :run (fn []
+                               (swap! started conj id)
+                               (deref gate 10000 nil))
+                        :on-wait (fn [position]
+                                   (when positions
+                                     (swap! positions conj position)))})
+    gate))
+
+(deftest interactive-tasks-go-first
+  (with-redefs [scheduler/max-tasks 1
+                scheduler/max-memory 4096]
+    (let [started (atom [])
+          running (submit! started "running" :interactive 512)
+          bulk (submit! started "bulk" :bulk 512)
+          interactive (submit! started "interactive" :interactive 512)]
+      (is (wait-until #(= ["running"] @started)))
+      (is (= {:running 1 :memory 512 :waiting {:interactive 1 :bulk 1}} (scheduler/status)))
+      (deliver running nil)
+      (is (wait-until #(= ["running" "interactive"] @started)))
+      (deliver interactive nil)
+      (is (wait-until #(= ["running" "interactive" "bulk"] @started)))
+      (deliver bulk nil)
+      (is (wait-until idle?)))))
+
+(deftest tasks-wait-for-the-memory-budget
+  (with-redefs [scheduler/max-tasks 3
+                scheduler/max-memory 1000]
+    (let [started (atom [])
+          positions (atom [])
+          first-task (submit! started "first" :interactive 600)
+          second-task (submit! started "second" :interactive 600 positions)
+          small (submit! started "small" :interactive 300)]
+      (is (wait-until #(= ["first"] @started)))
+      (testing "a task which doesn't fit holds back the tasks behind it"
+        (is (= {:running 1 :memory 600 :waiting {:interactive 2 :bulk 0}} (scheduler/status)))
+        (is (= [1] @positions)))
+      (deliver first-task nil)
+      (is (wait-until #(= #{"first" "second" "small"} (set @started))))
+      (is (= 900 (:memory (scheduler/status))))
+      (deliver second-task nil)
+      (deliver small nil)
+      (is (wait-until idle?)))))
+
+(deftest tasks-larger-than-the-budget-run-alone
+  (with-redefs [scheduler/max-tasks 3
+                scheduler/max-memory 1000]
+    (let [started (atom [])
+          large (submit! started "large" :bulk 4000)
+          small (submit! started "small" :interactive 100)]
+      (is (wait-until #(= ["large"] @started)))
+      (is (= 1 (:running (scheduler/status))))
+      (deliver large nil)
+      (is (wait-until #(= ["large" "small"] @started)))
+      (deliver small nil)
+      (is (wait-until idle?)))))
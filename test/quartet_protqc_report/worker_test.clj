@@ -0,0 +1,82 @@
+(ns quartet-protqc-report.worker-test
+  (:require [clojure.java.io :as io]
+            [clojure.string :as clj-str]
+            [clojure.test :refer [deftest is testing use-fixtures]]
+            [quartet-protqc-report.worker :as worker])
+  (:import [java.nio.file Files]
+           [java.nio.file.attribute FileAttribute]))
+
+;; A stub of protqc.sh -s: every start is appended to $STUB_STARTS, a RUN whose
+;; result directory contains "hang" never replies, one containing "fail" fails.
+(def ^:private stub-script
+  "#!/usr/bin/env bash
+echo \"$$\" >> \"$STUB_STARTS\"
+echo READY
+while read -r line; do
+  case \"$line\" in
+    PING) echo PONG ;;
+    QUIT) exit 0 ;;
+    RUN*hang*) sleep 30 ;;
+    RUN*fail*) printf 'ERROR\\tqc_conclusion failed\\n' ;;
+    RUN*) echo OK ;;
+  esac
+done
+")
+
+(def ^:dynamic *env* nil)
+
+(defn- stub-env
+  []
+  (let [dir (.toFile (Files/createTempDirectory "protqc-stub" (make-array FileAttribute 0)))
+        script (io/file dir "protqc.sh")]
+    (spit script stub-script)
+    (.setExecutable script true)
+    {:PATH (str dir ":" (System/getenv "PATH"))
+     :STUB_STARTS (str (io/file dir "starts"))}))
+
+(defn- starts
+  []
+  (let [file (io/file (:STUB_STARTS *env*))]
+    (if (.exists file)
+      (count (clj-str/split-lines (slurp file)))
+      0)))
+
+(defn- run-job!
+  [result-dir]
+  (worker/run-job! *env* "data.csv" "metadata.csv" result-dir))
+
+(use-fixtures :each
+  (fn [f]
+    (binding [*env* (stub-env)]
+      (try
+        (f)
+        (finally
+          (worker/shutdown!))))))
+
+(deftest warm-workers-are-reused
+  (is (= {:status "Success" :msg ""} (run-job! "result-1")))
+  (is (= {:status "Success" :msg ""} (run-job! "result-2")))
+  (testing "the idle worker answers PING and runs the second job"
+    (is (= 1 (starts)))))
+
+(deftest failed-jobs-keep-the-worker
+  (is (= {:status "Error" :msg "qc_conclusion failed"} (run-job! "fail")))
+  (is (= {:status "Success" :msg ""} (run-job! "result")))
+  (is (= 1 (starts))))
+
+(deftest workers-are-recycled-after-max-jobs
+  (with-redefs [worker/max-jobs 2]
+    (dotimes [i 5]
+      (is (= "Success" (:status (run-job! (str "result-" i))))))
+    ;; 2 + 2 + 1 jobs
+    (is (= 3 (starts)))))
+
+(deftest hung-jobs-time-out
+  (with-redefs [worker/job-timeout 1]
+    (let [start (System/currentTimeMillis)
+          result (run-job! "hang")]
+      (is (= {:status "Error" :msg "The R job didn't finish within 1 seconds."} result))
+      (is (< (- (System/currentTimeMillis) start) 15000)))
+    (testing "the worker is stopped, the next job starts a new one"
+      (is (= "Success" (:status (run-job! "result"))))
+      (is (= 2 (starts))))))